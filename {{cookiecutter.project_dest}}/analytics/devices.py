@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+# third party
+from analytics.settings import TRACK_USER_AGENT_CACHE_SIZE
+from model_utils import Choices
+from user_agents import parse
+
+
+DEVICE_TYPES = Choices(
+    'PC',
+    'MOBILE',
+    'TABLET',
+    'BOT',
+    'UNKNOWN',
+)
+
+
+class ParsedUserAgent(object):
+    """The parts of a parsed User-Agent header the project cares about"""
+    __slots__ = (
+        'browser',
+        'browser_version',
+        'os',
+        'os_version',
+        'device_model',
+        'device_type',
+        'is_mobile',
+    )
+
+    def __init__(self, browser, browser_version, os, os_version, device_model, device_type, is_mobile):
+        self.browser = browser
+        self.browser_version = browser_version
+        self.os = os
+        self.os_version = os_version
+        self.device_model = device_model
+        self.device_type = device_type
+        self.is_mobile = is_mobile
+
+
+@lru_cache(maxsize=TRACK_USER_AGENT_CACHE_SIZE)
+def parse_user_agent(user_agent_string):
+    """
+    Parses a raw User-Agent header once per process, the result is shared
+    so it must not be modified.
+    """
+    user_agent = parse(user_agent_string or '')
+    if user_agent.is_bot:
+        device_type = DEVICE_TYPES.BOT
+    elif user_agent.is_pc:
+        device_type = DEVICE_TYPES.PC
+    elif user_agent.is_tablet:
+        device_type = DEVICE_TYPES.TABLET
+    elif user_agent.is_mobile:
+        device_type = DEVICE_TYPES.MOBILE
+    else:
+        device_type = DEVICE_TYPES.UNKNOWN
+    return ParsedUserAgent(
+        browser=user_agent.browser.family,
+        browser_version=user_agent.browser.version_string,
+        os=user_agent.os.family,
+        os_version=user_agent.os.version_string,
+        device_model=user_agent.device.family,
+        device_type=device_type,
+        is_mobile=user_agent.is_mobile,
+    )
+
+
+def get_user_agent(request):
+    return parse_user_agent(request.META.get('HTTP_USER_AGENT', ''))
+
+
+def user_agent_cache_info():
+    info = parse_user_agent.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+    }
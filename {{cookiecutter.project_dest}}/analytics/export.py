@@ -0,0 +1,148 @@
+"""
+Streaming exports of WebEvent to gzip compressed, rotating CSV files.
+
+Rows are either copied out by Postgres (`COPY ... TO STDOUT`) or read with
+a server-side cursor, and written as they arrive, so an export of any size
+runs in constant memory.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+
+from django.db import connections
+
+# third party
+from analytics.models import WebEvent
+from common.forms import DjangoQuerysetJSONEncoder
+
+
+class RotatingGzipWriter(object):
+    """
+    File-like object writing CSV to `<prefix>_<NNN>.csv.gz` files, starting
+    a new file once `rotate_size` uncompressed bytes were written. Rotation
+    only happens at the end of a row: a newline outside of quotes.
+    """
+
+    def __init__(self, directory, prefix, header, rotate_size, compresslevel=6):
+        self.directory = directory
+        self.prefix = prefix
+        self.header = header
+        self.rotate_size = rotate_size
+        self.compresslevel = compresslevel
+        self.paths = []
+        self.written = 0  # uncompressed bytes
+        self._file = None
+        self._size = 0
+        # odd while the data written so far ends inside a quoted field
+        self._quoted = False
+
+    def _open(self):
+        path = os.path.join(self.directory, '%s_%03d.csv.gz' % (self.prefix, len(self.paths) + 1))
+        self._file = gzip.open(path, 'wb', compresslevel=self.compresslevel)
+        self._file.write(self.header)
+        self._size = len(self.header)
+        self.paths.append(path)
+
+    def _split_point(self, data):
+        """Offset just past the first row end of `data`, None when there's none"""
+        quoted = self._quoted
+        start = 0
+        while True:
+            newline = data.find(b'\n', start)
+            if newline == -1:
+                return None
+            quoted ^= data.count(b'"', start, newline) % 2 == 1
+            if not quoted:
+                return newline + 1
+            start = newline + 1
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        while data:
+            if self._file is None:
+                self._open()
+            split = self._split_point(data) if self._size + len(data) > self.rotate_size else None
+            if split is None:
+                self._file.write(data)
+                self._size += len(data)
+                self._track(data)
+                return
+            head, data = data[:split], data[split:]
+            self._file.write(head)
+            self._track(head)
+            self._file.close()
+            self._file = None
+
+    def _track(self, data):
+        self._quoted ^= data.count(b'"') % 2 == 1
+        self.written += len(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def get_columns():
+    return [field.column for field in WebEvent._meta.concrete_fields]
+
+
+def get_header():
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(get_columns())
+    return buffer.getvalue().encode('utf-8')
+
+
+def export_copy(writer, start, end, using):
+    """Streams the events of [start, end) into `writer` with COPY"""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        query = cursor.mogrify(
+            'SELECT {columns} FROM {table} WHERE created >= %s AND created < %s'.format(
+                columns=', '.join(qn(column) for column in get_columns()),
+                table=qn(WebEvent._meta.db_table),
+            ),
+            [start, end],
+        )
+        if isinstance(query, bytes):
+            query = query.decode('utf-8')
+        cursor.copy_expert('COPY (%s) TO STDOUT WITH (FORMAT csv)' % query, writer)
+
+
+def export_iterator(writer, start, end, using, chunk_size):
+    """Streams the events of [start, end) into `writer` through a server-side cursor"""
+    rows = WebEvent.objects.using(using).filter(
+        created__gte=start, created__lt=end,
+    ).order_by().values_list(*[field.attname for field in WebEvent._meta.concrete_fields])
+    buffer = io.StringIO()
+    csv_writer = csv.writer(buffer, lineterminator='\n')
+    for count, row in enumerate(rows.iterator(chunk_size=chunk_size), 1):
+        # jsonb and hstore columns as JSON
+        csv_writer.writerow([
+            json.dumps(value, cls=DjangoQuerysetJSONEncoder) if isinstance(value, (dict, list)) else value
+            for value in row
+        ])
+        if count % chunk_size == 0:
+            writer.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+    writer.write(buffer.getvalue())
+
+
+def export_range(directory, prefix, start, end, using, method='copy', rotate_size=256 * 1024 * 1024,
+                 chunk_size=2000):
+    """Exports the events of [start, end), returns (paths, uncompressed bytes)"""
+    writer = RotatingGzipWriter(directory, prefix, get_header(), rotate_size)
+    try:
+        if method == 'copy':
+            export_copy(writer, start, end, using)
+        else:
+            export_iterator(writer, start, end, using, chunk_size)
+    finally:
+        writer.close()
+        connections[using].close()
+    return writer.paths, writer.written
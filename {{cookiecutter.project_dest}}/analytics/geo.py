@@ -0,0 +1,67 @@
+import logging
+import os
+import threading
+from functools import lru_cache
+
+from django.contrib.gis.geoip2 import GeoIP2, GeoIP2Exception
+
+# third party
+from analytics.settings import TRACK_GEOIP_CACHE_MODE, TRACK_GEOIP_LRU_SIZE
+from geoip2.errors import GeoIP2Error
+
+
+logger = logging.getLogger('analytics')
+
+UNKNOWN_LOCATION = ('', '', '')
+
+_reader = None
+_reader_pid = None
+_reader_lock = threading.Lock()
+
+
+def get_reader():
+    """
+    GeoIP2 reader opened once per process (re-opened after a fork),
+    None when the database can't be opened
+    """
+    global _reader, _reader_pid
+    if _reader_pid != os.getpid():
+        with _reader_lock:
+            if _reader_pid != os.getpid():
+                try:
+                    _reader = GeoIP2(cache=TRACK_GEOIP_CACHE_MODE)
+                except (GeoIP2Error, GeoIP2Exception):
+                    logger.exception('Unable to open the GeoIP2 database')
+                    _reader = None
+                _reader_pid = os.getpid()
+    return _reader
+
+
+@lru_cache(maxsize=TRACK_GEOIP_LRU_SIZE)
+def lookup_location(ip_address):
+    """Returns (country code, region, city) of `ip_address`"""
+    reader = get_reader()
+    if reader is None:
+        return UNKNOWN_LOCATION
+    try:
+        city = reader.city(ip_address)
+    except (GeoIP2Error, GeoIP2Exception, ValueError):
+        logger.debug('Unable to determine geolocation for address %s', ip_address)
+        return UNKNOWN_LOCATION
+    return (
+        city.get('country_code', '') or '',
+        city.get('region', '') or '',
+        city.get('city', '') or '',
+    )
+
+
+def location_cache_info():
+    info = lookup_location.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+    }
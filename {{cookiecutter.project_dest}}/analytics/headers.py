@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.db import router, transaction
+
+# third party
+from analytics.models import ResponseHeaderSet
+from analytics.settings import (
+    TRACK_HEADER_SET_CACHE_SIZE, TRACK_IGNORE_REQUEST_PARAMS,
+    TRACK_REQUEST_PARAMS, TRACK_RESPONSE_HEADERS,
+    TRACK_RESPONSE_VALUE_HEADERS, TRACK_VALUE_MAX_LENGTH,
+)
+
+
+allowed_headers = None if TRACK_RESPONSE_HEADERS is None else {name.lower() for name in TRACK_RESPONSE_HEADERS}
+value_headers = {name.lower() for name in TRACK_RESPONSE_VALUE_HEADERS}
+allowed_params = None if TRACK_REQUEST_PARAMS is None else set(TRACK_REQUEST_PARAMS)
+ignored_params = set(TRACK_IGNORE_REQUEST_PARAMS)
+
+
+def truncate(value):
+    return value[:TRACK_VALUE_MAX_LENGTH] if isinstance(value, str) else value
+
+
+def filter_headers(headers):
+    """Keeps the allowed (name, value) response headers, values truncated"""
+    return {
+        name: truncate(value) for name, value in headers
+        if allowed_headers is None or name.lower() in allowed_headers
+    }
+
+
+def filter_params(params):
+    """Keeps the allowed parameters of a QueryDict as {name: [values]}, values truncated"""
+    return {
+        name: [truncate(value) for value in values]
+        for name, values in params.lists()
+        if name not in ignored_params and (allowed_params is None or name in allowed_params)
+    }
+
+
+def split_headers(headers):
+    """Returns (headers shared by many responses, per response headers)"""
+    shared, values = {}, {}
+    for name, value in headers.items():
+        (values if name.lower() in value_headers else shared)[name] = value
+    return shared, values
+
+
+def get_digest(headers):
+    content = '\0'.join('%s\0%s' % item for item in sorted(headers.items()))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class HeaderSets(object):
+    """
+    Stores each distinct set of response headers once (ResponseHeaderSet)
+    and keeps the ids of the `size` most recently seen ones per process and
+    database. Ids stored within a transaction are only cached once it commits.
+    """
+
+    def __init__(self, size=TRACK_HEADER_SET_CACHE_SIZE):
+        self.size = size
+        # (database, digest) -> id
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_ids(self, header_sets, using=None):
+        """Returns the ids of a list of header dicts, None for empty ones"""
+        using = using or router.db_for_write(ResponseHeaderSet)
+        digests = [get_digest(headers) if headers else None for headers in header_sets]
+        with self._lock:
+            # read now, other threads may evict them before the end
+            ids = {digest: self._ids[using, digest] for digest in digests if (using, digest) in self._ids}
+        missing = {
+            digest: headers for digest, headers in zip(digests, header_sets)
+            if digest is not None and digest not in ids
+        }
+        stored = ResponseHeaderSet.objects.get_ids(missing, using=using) if missing else {}
+        self.remember(using, ids)
+        # right away outside of a transaction
+        transaction.on_commit(lambda: self.remember(using, stored), using=using)
+        ids.update(stored)
+        return [None if digest is None else ids[digest] for digest in digests]
+
+    def remember(self, using, ids):
+        with self._lock:
+            for digest, header_set_id in ids.items():
+                self._ids[using, digest] = header_set_id
+                self._ids.move_to_end((using, digest))
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+
+    def intern(self, events, using=None):
+        """
+        Replaces the `response_data` of WebEvent values by a reference to
+        the stored header set, keeping only the per response headers,
+        returns new dicts
+        """
+        splits = [split_headers(event.get('response_data') or {}) for event in events]
+        ids = self.get_ids([shared for shared, values in splits], using=using)
+        return [
+            dict(event, response_data=values, response_headers_id=header_set_id)
+            for event, (shared, values), header_set_id in zip(events, splits, ids)
+        ]
+
+
+header_sets = HeaderSets()
@@ -0,0 +1,67 @@
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+# third party
+from analytics.matching import IgnoreMatcher
+
+
+BROWSER_USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 10; SM-G973F) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.99 Mobile Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:82.0) Gecko/20100101 Firefox/82.0',
+)
+
+
+class Command(BaseCommand):
+    help = 'Times the ignored user agent check of VisitorTrackingMiddleware against large pattern lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patterns', type=int, default=10000)
+        parser.add_argument('--user-agents', type=int, default=2000, help='distinct user agents')
+        parser.add_argument('--checks', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        count = options['patterns']
+        # half plain bot names, half regular expressions
+        patterns = ['SomeBot%05d' % i for i in range(count // 2)]
+        patterns += [r'.*crawler-%05d/\d+' % i for i in range(count - count // 2)]
+
+        user_agents = [
+            '%s %05d' % (random.choice(BROWSER_USER_AGENTS), i) for i in range(options['user_agents'])
+        ]
+        user_agents += ['SomeBot%05d/2.1' % random.randrange(count // 2) for _ in range(options['user_agents'] // 10)]
+        checks = [random.choice(user_agents) for _ in range(options['checks'])]
+
+        start = time.perf_counter()
+        regexes = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+        self.report('compile loop', time.perf_counter() - start, 1)
+
+        start = time.perf_counter()
+        matcher = IgnoreMatcher(patterns, flags=re.IGNORECASE)
+        self.report('compile matcher', time.perf_counter() - start, 1)
+        cached_matcher = IgnoreMatcher(patterns, flags=re.IGNORECASE, cache_size=options['user_agents'] * 2)
+
+        # The loop is slow enough that a sample of the checks is plenty
+        sample = checks[:max(1, len(checks) // 20)]
+        start = time.perf_counter()
+        expected = [any(regex.match(user_agent) for regex in regexes) for user_agent in sample]
+        self.report('loop', time.perf_counter() - start, len(sample))
+
+        for name, check in (('matcher', matcher), ('cached matcher', cached_matcher)):
+            assert [check(user_agent) for user_agent in sample] == expected, 'verdicts differ from the loop'
+            start = time.perf_counter()
+            for user_agent in checks:
+                check(user_agent)
+            self.report(name, time.perf_counter() - start, len(checks))
+
+    def report(self, name, elapsed, count):
+        self.stdout.write('{name:<16} {per_call:10.2f}us per call  ({count} calls, {elapsed:.3f}s)'.format(
+            name=name,
+            per_call=elapsed / count * 10**6,
+            count=count,
+            elapsed=elapsed,
+        ))
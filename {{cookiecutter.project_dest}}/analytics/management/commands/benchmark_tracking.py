@@ -0,0 +1,101 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+# third party
+from analytics.metrics import metrics
+from analytics.models import Visitor, WebEvent
+
+
+USER_AGENTS = (
+    # (share of the traffic, User-Agent)
+    (0.55, 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36'),
+    (0.30, 'Mozilla/5.0 (Linux; Android 10; SM-G973F) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.99 Mobile Safari/537.36'),
+    (0.05, 'Mozilla/5.0 (iPad; CPU OS 14_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Mobile/15E148'),
+    (0.10, 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays a synthetic traffic mix through the test client with and without '
+        'VisitorTrackingMiddleware and reports the per-phase p50/p95/p99 of the tracking'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--sessions', type=int, default=200, help='clients, each keeping its session cookie')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='keep the Visitor and WebEvent rows')
+
+    def handle(self, *args, **options):
+        paths = (
+            # (share of the traffic, path)
+            (0.6, reverse('admin:login')),
+            (0.3, reverse('admin:index')),
+            (0.1, '/does-not-exist/'),
+        )
+        random.seed(options['seed'])
+        plan = [
+            (
+                random.randrange(options['sessions']),
+                self.pick(paths),
+                self.pick(USER_AGENTS),
+                '81.2.69.%d' % random.randrange(1, 255),
+            )
+            for _ in range(options['requests'])
+        ]
+
+        middleware = list(settings.MIDDLEWARE) + ['analytics.middleware.VisitorTrackingMiddleware']
+        with override_settings(ALLOWED_HOSTS=['*']):
+            baseline, _ = self.replay(plan, options['sessions'])
+            with override_settings(MIDDLEWARE=middleware):
+                metrics.reset()
+                tracked, clients = self.replay(plan, options['sessions'])
+
+        self.report('request without tracking', baseline)
+        self.report('request with tracking', tracked)
+        for phase, stats in sorted(metrics.snapshot().items()):
+            self.stdout.write(
+                '  {phase:<22} {count:6d} calls  p50 {p50_ms:7.3f}ms  p95 {p95_ms:7.3f}ms  p99 {p99_ms:7.3f}ms'.format(
+                    phase=phase, **stats,
+                ),
+            )
+
+        if not options['keep']:
+            session_keys = [
+                client.cookies[settings.SESSION_COOKIE_NAME].value
+                for client in clients if settings.SESSION_COOKIE_NAME in client.cookies
+            ]
+            WebEvent.objects.filter(visitor__session_key__in=session_keys).delete()
+            Visitor.objects.filter(session_key__in=session_keys).delete()
+
+    def pick(self, weighted):
+        threshold = random.random()
+        for share, value in weighted:
+            threshold -= share
+            if threshold <= 0:
+                return value
+        return weighted[-1][1]
+
+    def replay(self, plan, sessions):
+        clients = [Client() for _ in range(sessions)]
+        timings = []
+        for client_index, path, user_agent, ip_address in plan:
+            start = time.perf_counter()
+            clients[client_index].get(path, HTTP_USER_AGENT=user_agent, HTTP_X_FORWARDED_FOR=ip_address)
+            timings.append(time.perf_counter() - start)
+        return sorted(timings), clients
+
+    def report(self, name, timings):
+        self.stdout.write('{name:<24} p50 {p50:7.3f}ms  p95 {p95:7.3f}ms  p99 {p99:7.3f}ms'.format(
+            name=name,
+            p50=timings[int(len(timings) * 0.50)] * 1000,
+            p95=timings[int(len(timings) * 0.95)] * 1000,
+            p99=timings[int(len(timings) * 0.99)] * 1000,
+        ))
@@ -0,0 +1,106 @@
+import random
+import statistics
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+# third party
+from analytics.middleware import VisitorTrackingMiddleware
+from analytics.models import Visitor
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the get-then-save Visitor refresh with the single statement upsert '
+        'while several threads hit the same sessions, like concurrent tabs do'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--hits', type=int, default=200, help='hits per thread')
+        parser.add_argument('--sessions', type=int, default=20, help='sessions shared by all the threads')
+
+    def handle(self, *args, **options):
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        sessions = []
+        for i in range(options['sessions']):
+            session = session_store()
+            session['benchmark'] = i
+            session.create()
+            sessions.append(session)
+
+        middleware = VisitorTrackingMiddleware()
+        factory = RequestFactory()
+        alias = router.db_for_write(Visitor)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                for name, refresh in (
+                    ('get + save', middleware._save_visitor),
+                    ('upsert', middleware._upsert_visitor),
+                ):
+                    Visitor.objects.filter(session_key__in=[s.session_key for s in sessions]).delete()
+                    queries = self.count_queries(alias, refresh, factory, sessions)
+                    elapsed, timings = self.run_threads(refresh, factory, sessions, options['threads'], options['hits'])
+                    self.report(name, elapsed, timings, queries)
+        finally:
+            Visitor.objects.filter(session_key__in=[s.session_key for s in sessions]).delete()
+            for session in sessions:
+                session.delete()
+
+    def make_request(self, factory, session):
+        request = factory.get('/benchmark/', HTTP_USER_AGENT='benchmark')
+        request.session = session
+        return request
+
+    def count_queries(self, alias, refresh, factory, sessions):
+        request = self.make_request(factory, sessions[0])
+        refresh(None, request, timezone.now())
+        with CaptureQueriesContext(connections[alias]) as context:
+            refresh(None, request, timezone.now())
+        return len(context.captured_queries)
+
+    def run_threads(self, refresh, factory, sessions, thread_count, hits):
+        timings = []
+        barrier = threading.Barrier(thread_count)
+
+        def worker():
+            local_timings = []
+            barrier.wait()
+            try:
+                for _ in range(hits):
+                    request = self.make_request(factory, random.choice(sessions))
+                    start = time.perf_counter()
+                    refresh(None, request, timezone.now())
+                    local_timings.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            timings.extend(local_timings)
+
+        threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, sorted(timings)
+
+    def report(self, name, elapsed, timings, queries):
+        self.stdout.write(
+            '{name:<12} {queries} queries/hit  {rate:8.1f} hits/s  '
+            'mean {mean:6.2f}ms  p50 {p50:6.2f}ms  p95 {p95:6.2f}ms  p99 {p99:6.2f}ms'.format(
+                name=name,
+                queries=queries,
+                rate=len(timings) / elapsed,
+                mean=statistics.mean(timings) * 1000,
+                p50=timings[int(len(timings) * 0.50)] * 1000,
+                p95=timings[int(len(timings) * 0.95)] * 1000,
+                p99=timings[int(len(timings) * 0.99)] * 1000,
+            ),
+        )
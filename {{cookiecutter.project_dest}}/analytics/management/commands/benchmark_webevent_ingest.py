@@ -0,0 +1,83 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.utils import timezone
+
+# third party
+from analytics.loader import WebEventLoader
+from analytics.models import WebEvent
+from analytics.writer import EventRecord, write_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the throughput of bulk_create and COPY for writing event records, '
+        'every run is rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=50000)
+        parser.add_argument('--sessions', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        records = self.make_records(options['events'], options['sessions'])
+        batch_size = options['batch_size']
+        loader = WebEventLoader()
+
+        for name, write in (
+            ('bulk_create', write_records),
+            ('copy', loader.load_records),
+        ):
+            using = router.db_for_write(WebEvent)
+            with transaction.atomic(using=using):
+                start = time.perf_counter()
+                for offset in range(0, len(records), batch_size):
+                    write(records[offset:offset + batch_size])
+                elapsed = time.perf_counter() - start
+                transaction.set_rollback(True, using=using)
+            self.stdout.write('{name:<12} {rate:10.0f} events/s  ({elapsed:.2f}s)'.format(
+                name=name, rate=len(records) / elapsed, elapsed=elapsed,
+            ))
+
+    def make_records(self, count, sessions):
+        now = timezone.now()
+        records = []
+        for i in range(count):
+            visit_time = now - datetime.timedelta(seconds=count - i)
+            records.append(EventRecord(
+                session_key='benchmark-%06d' % random.randrange(sessions),
+                visit_time=visit_time,
+                visitor={
+                    'landing_url': 'https://example.com/',
+                    'expiry_age': 1209600,
+                    'expiry_time': visit_time + datetime.timedelta(days=14),
+                    'user_agent': 'benchmark',
+                    'data': None,
+                },
+                event={
+                    'data': {'q': ['shoes'], 'page': ['%d' % (i % 10)]},
+                    'url': 'https://example.com/search/?q=shoes',
+                    'url_name': 'search',
+                    'url_kwargs': {},
+                    'method': 'GET',
+                    'response_data': {'Content-Type': 'text/html; charset=utf-8', 'X-Frame-Options': 'DENY'},
+                    'status_code': 200,
+                    'referrer': '',
+                    'browser': 'Chrome',
+                    'browser_version': '86.0',
+                    'os': 'Windows',
+                    'os_version': '10',
+                    'device_model': 'Other',
+                    'device_type': 'PC',
+                    'ip_address': '10.0.0.%d' % (i % 250),
+                    'ip_country': 'IN',
+                    'ip_region': '',
+                    'ip_city': '',
+                    'sample_weight': 1,
+                },
+            ))
+        return records
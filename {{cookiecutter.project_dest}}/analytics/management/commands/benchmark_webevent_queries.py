@@ -0,0 +1,117 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+# third party
+from analytics.models import Visitor, WebEvent
+
+
+SESSION_KEY_PREFIX = 'benchmark-'
+URL_NAMES = ('home', 'product', 'category', 'cart', 'checkout', 'search', 'account', 'blog')
+UTM_SOURCES = ('newsletter', 'google', 'facebook', 'twitter', 'partner')
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds synthetic web events and prints the plans and timings of the usual report '
+        'queries with and without the WebEvent indexes (dropped in a rolled back transaction)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=200000)
+        parser.add_argument('--visitors', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=60, help='days the events are spread over')
+        parser.add_argument('--repeat', type=int, default=5, help='runs of every query')
+        parser.add_argument('--keep', action='store_true', help='keep the seeded rows')
+
+    def handle(self, *args, **options):
+        alias = router.db_for_write(WebEvent)
+        now = timezone.now()
+        visitor_ids = self.seed(alias, now, options['events'], options['visitors'], options['days'])
+        try:
+            queries = self.get_queries(now, random.choice(visitor_ids))
+            self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+            self.run_queries(queries, options['repeat'])
+
+            with transaction.atomic(using=alias):
+                with connections[alias].schema_editor() as schema_editor:
+                    for index in WebEvent._meta.indexes:
+                        schema_editor.remove_index(WebEvent, index)
+                self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+                self.run_queries(queries, options['repeat'])
+                transaction.set_rollback(True, using=alias)
+        finally:
+            if not options['keep']:
+                WebEvent.objects.filter(visitor__session_key__startswith=SESSION_KEY_PREFIX).delete()
+                Visitor.objects.filter(session_key__startswith=SESSION_KEY_PREFIX).delete()
+
+    def seed(self, alias, now, event_count, visitor_count, days):
+        start = now - datetime.timedelta(days=days)
+        visitors = Visitor.objects.bulk_create([
+            Visitor(
+                session_key='%s%06d' % (SESSION_KEY_PREFIX, i),
+                created=start,
+                landing_url='https://example.com/',
+            )
+            for i in range(visitor_count)
+        ])
+        visitor_ids = [visitor.pk for visitor in visitors]
+
+        step = (now - start) / event_count
+        batch = []
+        for i in range(event_count):
+            url_name = random.choice(URL_NAMES)
+            batch.append(WebEvent(
+                visitor_id=random.choice(visitor_ids),
+                # in insertion order, like real traffic
+                created=start + step * i,
+                marketing_params={'utm_source': random.choice(UTM_SOURCES)} if random.random() < 0.2 else {},
+                referrer='',
+                url='https://example.com/%s/' % url_name,
+                url_kwargs={'slug': 'item-%d' % random.randrange(1000)} if url_name == 'product' else {},
+                url_name=url_name,
+                status_code=200,
+                method='GET',
+                device_type=random.choice(WebEvent.DEVICE_TYPES)[0],
+                ip_country='IN',
+            ))
+            if len(batch) == 5000:
+                WebEvent.objects.bulk_create(batch)
+                batch = []
+        WebEvent.objects.bulk_create(batch)
+
+        with connections[alias].cursor() as cursor:
+            cursor.execute('ANALYZE %s' % connections[alias].ops.quote_name(WebEvent._meta.db_table))
+        return visitor_ids
+
+    def get_queries(self, now, visitor_id):
+        events = WebEvent.objects.order_by()
+        return (
+            ('last day', events.filter(created__gte=now - datetime.timedelta(days=1)).values('url_name')),
+            ('url_name per week', events.filter(
+                url_name='product', created__gte=now - datetime.timedelta(days=7),
+            ).values('created')),
+            ('visitor history', events.filter(visitor_id=visitor_id).order_by('created').values('url')),
+            ('marketing source', events.filter(marketing_params__contains={'utm_source': 'newsletter'}).values('id')),
+            ('url kwargs', events.filter(url_kwargs__contains={'slug': 'item-7'}).values('id')),
+        )
+
+    def run_queries(self, queries, repeat):
+        for name, queryset in queries:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - start)
+            self.stdout.write('{name:<20} median {median:8.2f}ms  min {min:8.2f}ms'.format(
+                name=name,
+                median=statistics.median(timings) * 1000,
+                min=min(timings) * 1000,
+            ))
+            self.stdout.write(queryset.explain(analyze=True, buffers=True))
+            self.stdout.write('')
@@ -0,0 +1,62 @@
+import fcntl
+import json
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, router
+
+# third party
+from analytics.loader import WebEventLoader
+from analytics.models import WebEvent
+from analytics.settings import TRACK_SPOOL_DIR
+from analytics.spool import drain, spool_stats
+
+
+logger = logging.getLogger('analytics')
+
+
+class Command(BaseCommand):
+    help = 'Ships the sealed segments of the analytics disk spool to the database, runs until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=TRACK_SPOOL_DIR)
+        parser.add_argument('--interval', type=float, default=1.0, help='seconds between two drains')
+        parser.add_argument('--once', action='store_true', help='drain once and exit')
+        parser.add_argument('--stats', action='store_true', help='print the spool depth and lag as JSON and exit')
+        parser.add_argument('--database', default=router.db_for_write(WebEvent))
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if options['stats']:
+            self.stdout.write(json.dumps(spool_stats(directory)))
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        lock = open(os.path.join(directory, '.drain.lock'), 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise CommandError('Another drain_spool is running on %s' % directory)
+
+        loader = WebEventLoader(using=options['database'])
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    drained = drain(directory, loader.load_records)
+                except Exception:
+                    # the segment stays on disk and is retried on the next round
+                    logger.exception('Unable to drain the analytics spool')
+                    drained = 0
+                if drained or options['verbosity'] > 1:
+                    stats = spool_stats(directory)
+                    self.stdout.write('drained {drained} events, {segments} segments left, lag {lag:.1f}s'.format(
+                        drained=drained, segments=stats['sealed_segments'] + stats['open_segments'], lag=stats['lag'],
+                    ))
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            lock.close()
@@ -0,0 +1,72 @@
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+# third party
+from analytics.export import export_range
+from analytics.models import WebEvent
+from analytics.partitions import add_months
+
+
+class Command(BaseCommand):
+    help = (
+        'Exports the web events of a date range to gzip compressed, rotating CSV files, '
+        'one month at a time in parallel'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='first day, YYYY-MM-DD')
+        parser.add_argument('end', help='last day, YYYY-MM-DD')
+        parser.add_argument('--output-dir', default='.')
+        parser.add_argument('--method', choices=('copy', 'iterator'), default='copy')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--rotate-size', type=int, default=256, help='uncompressed MB per file')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='rows per fetch with --method iterator')
+        parser.add_argument('--database', default=router.db_for_read(WebEvent))
+
+    def handle(self, *args, **options):
+        start, end = parse_date(options['start']), parse_date(options['end'])
+        if start is None or end is None or start > end:
+            raise CommandError('start and end must be dates, YYYY-MM-DD, start first')
+        os.makedirs(options['output_dir'], exist_ok=True)
+
+        jobs = []
+        for lower, upper in self.split_months(start, end + datetime.timedelta(days=1)):
+            jobs.append((
+                options['output_dir'],
+                'webevents_%s' % lower.strftime('%Y%m%d'),
+                timezone.make_aware(datetime.datetime.combine(lower, datetime.time())),
+                timezone.make_aware(datetime.datetime.combine(upper, datetime.time())),
+                options['database'],
+                options['method'],
+                options['rotate_size'] * 1024 * 1024,
+                options['chunk_size'],
+            ))
+
+        if options['workers'] > 1 and len(jobs) > 1:
+            # forked workers must open their own connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                results = list(executor.map(export_range, *zip(*jobs)))
+        else:
+            results = [export_range(*job) for job in jobs]
+
+        for paths, written in results:
+            for path in paths:
+                self.stdout.write(path)
+        self.stdout.write('exported %.1f MB (uncompressed) in %d files' % (
+            sum(written for _, written in results) / 1024 / 1024,
+            sum(len(paths) for paths, _ in results),
+        ))
+
+    def split_months(self, start, end):
+        """[start, end) dates split on month boundaries, like the partitions"""
+        while start < end:
+            upper = min(end, add_months(start, 1))
+            yield start, upper
+            start = upper
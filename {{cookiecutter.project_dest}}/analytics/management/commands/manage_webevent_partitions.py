@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+# third party
+from analytics.models import WebEvent
+from analytics.partitions import (
+    ensure_partitions, expire_partitions, list_partitions,
+)
+from analytics.settings import (
+    TRACK_WEBEVENT_PARTITIONS_AHEAD, TRACK_WEBEVENT_RETENTION_MONTHS,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the monthly WebEvent partitions ahead of time and detaches (or drops) '
+        'the ones past retention, meant to run daily from cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=TRACK_WEBEVENT_PARTITIONS_AHEAD)
+        parser.add_argument('--retention-months', type=int, default=TRACK_WEBEVENT_RETENTION_MONTHS)
+        parser.add_argument('--drop', action='store_true', help='drop expired partitions instead of detaching them')
+        parser.add_argument('--database', default=router.db_for_write(WebEvent))
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+
+        for name in ensure_partitions(connection, options['months_ahead']):
+            self.stdout.write('created %s' % name)
+
+        if options['retention_months'] is not None:
+            for name in expire_partitions(connection, options['retention_months'], drop=options['drop']):
+                self.stdout.write('%s %s' % ('dropped' if options['drop'] else 'detached', name))
+
+        if options['verbosity'] > 1:
+            for name, lower, upper in list_partitions(connection):
+                self.stdout.write('{name:<40} {lower} -> {upper}'.format(name=name, lower=lower, upper=upper))
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import router
+
+# third party
+from analytics.loader import WebEventLoader
+from analytics.models import WebEvent
+from analytics.writer import load_record
+
+
+class Command(BaseCommand):
+    help = 'Loads newline-delimited JSON event records (as written by analytics.writer.dump_record) with COPY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="spool files, '-' reads stdin")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--database', default=router.db_for_write(WebEvent))
+
+    def handle(self, *args, **options):
+        loader = WebEventLoader(using=options['database'])
+        total = 0
+        for path in options['paths']:
+            written = 0
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+            try:
+                batch = []
+                for line in stream:
+                    if not line.strip():
+                        continue
+                    batch.append(load_record(line))
+                    if len(batch) == options['batch_size']:
+                        written += loader.load_records(batch)
+                        batch = []
+                if batch:
+                    written += loader.load_records(batch)
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+            self.stdout.write('%s: %d events' % (path, written))
+            total += written
+        self.stdout.write('replayed %d events' % total)
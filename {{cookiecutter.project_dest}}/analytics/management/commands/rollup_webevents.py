@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+from django.utils.dateparse import parse_date
+
+# third party
+from analytics.models import WebEvent
+from analytics.rollups import fold_events, rebuild
+from analytics.settings import TRACK_ROLLUP_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Folds the web events recorded since the last run into the daily and hourly rollups, '
+        'safe to re-run and meant to run every few minutes from cron'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=TRACK_ROLLUP_BATCH_SIZE)
+        parser.add_argument('--rebuild', nargs=2, metavar=('START', 'END'), help='recount the days from START to END')
+        parser.add_argument('--database', default=router.db_for_write(WebEvent))
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            start, end = [parse_date(value) for value in options['rebuild']]
+            if start is None or end is None or start > end:
+                raise CommandError('--rebuild expects two dates, YYYY-MM-DD YYYY-MM-DD')
+            rebuild(start, end, using=options['database'])
+            self.stdout.write('rebuilt %s to %s' % (start, end))
+
+        written = fold_events(options['batch_size'], using=options['database'])
+        self.stdout.write('folded the new events into %s daily rollup rows' % written)
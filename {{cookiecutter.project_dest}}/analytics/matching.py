@@ -0,0 +1,123 @@
+import re
+from functools import lru_cache
+
+
+# Characters that give a pattern more meaning than its literal text
+REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+QUANTIFIER_CHARS = frozenset('*+?{')
+# `re.match(r'.*foo', value)` is `re.search(r'foo', value)` for single line values
+SEARCH_PREFIXES = ('.*?', '.*')
+# Group references would point at another pattern's groups once combined
+BACKREFERENCE_RE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def split_literal_prefix(pattern):
+    """
+    Splits `pattern` into its leading literal text and the regular expression
+    that follows it, eg. 'Googlebot/\\d+' -> ('Googlebot/', '\\d+')
+    """
+    if '|' in pattern or pattern.startswith('(?'):
+        # alternations and inline flags apply to the whole pattern
+        return '', pattern
+    end = 0
+    while end < len(pattern) and pattern[end] not in REGEX_SPECIAL_CHARS:
+        end += 1
+    if end < len(pattern) and pattern[end] in QUANTIFIER_CHARS:
+        # the quantifier applies to the last literal character
+        end -= 1
+    return pattern[:end], pattern[end:]
+
+
+class PrefixTrie(object):
+    """Compiles many patterns into one regex that branches on their literal prefixes"""
+
+    def __init__(self):
+        self.children = {}
+        self.rests = []
+
+    def add(self, prefix, rest):
+        node = self
+        for char in prefix:
+            node = node.children.setdefault(char, PrefixTrie())
+        node.rests.append(rest)
+
+    def to_regex(self):
+        alternatives = []
+        for char, child in sorted(self.children.items()):
+            # collapse chains of single children into a plain literal
+            literal = char
+            while len(child.children) == 1 and not child.rests:
+                (char, child), = child.children.items()
+                literal += char
+            alternatives.append(re.escape(literal) + child.to_regex())
+        alternatives.extend('(?:%s)' % rest if rest else '' for rest in self.rests)
+        if alternatives == ['']:
+            return ''
+        return '(?:%s)' % '|'.join(alternatives)
+
+
+class IgnoreMatcher(object):
+    """
+    Tells whether a string `re.match`es any of `patterns`.
+
+    The patterns are compiled into a couple of regexes which branch on the
+    literal prefix of every pattern (a trie), so a check doesn't have to try
+    the patterns one by one. Patterns starting with '.*' are searched for
+    instead. Verdicts are kept in an LRU cache of `cache_size` entries when
+    it's set.
+    """
+
+    def __init__(self, patterns, flags=0, cache_size=None):
+        self.patterns = tuple(patterns)
+        self.flags = flags
+
+        anchored = PrefixTrie()
+        searched = PrefixTrie()
+        self.regexes = []
+        for pattern in self.patterns:
+            if BACKREFERENCE_RE.search(pattern):
+                self.regexes.append(re.compile(pattern, flags))
+                continue
+            trie = anchored
+            if pattern.startswith('^'):
+                pattern = pattern[1:]
+            else:
+                for search_prefix in SEARCH_PREFIXES:
+                    if pattern.startswith(search_prefix):
+                        pattern = pattern[len(search_prefix):]
+                        trie = searched
+                        break
+            prefix, rest = split_literal_prefix(pattern)
+            if flags & re.IGNORECASE:
+                prefix = prefix.lower()
+            trie.add(prefix, rest)
+
+        try:
+            self.match = self._compile(anchored, flags, 'match')
+            self.search = self._compile(searched, flags, 'search')
+        except re.error:
+            # eg. the same group name used by two patterns, keep them apart
+            self.regexes = [re.compile(pattern, flags) for pattern in self.patterns]
+            self.match = self.search = None
+
+        if cache_size:
+            self.matches = lru_cache(maxsize=cache_size)(self.matches)
+
+    @staticmethod
+    def _compile(trie, flags, method):
+        if not trie.children and not trie.rests:
+            return None
+        return getattr(re.compile(trie.to_regex(), flags), method)
+
+    def matches(self, value):
+        if self.match is not None and self.match(value):
+            return True
+        if self.search is not None and self.search(value):
+            return True
+        return any(regex.match(value) for regex in self.regexes)
+
+    def __call__(self, value):
+        return self.matches(value)
+
+    def cache_info(self):
+        return self.matches.cache_info() if hasattr(self.matches, 'cache_info') else None
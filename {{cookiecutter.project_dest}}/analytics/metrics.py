@@ -0,0 +1,119 @@
+"""
+In-process timings of the phases of VisitorTrackingMiddleware.
+
+Every phase keeps a count, a total and a reservoir of its latest
+durations for percentiles. They're exposed by `watchman_check` (listed in
+WATCHMAN_CHECKS) and sent to statsd when TRACK_STATSD_HOST is set.
+"""
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# third party
+from analytics.devices import user_agent_cache_info
+from analytics.geo import location_cache_info
+from analytics.settings import (
+    TRACK_METRICS, TRACK_METRICS_RESERVOIR_SIZE,
+    TRACK_STATSD_HOST, TRACK_STATSD_PORT, TRACK_STATSD_PREFIX,
+)
+from analytics.spool import spool_writer
+from analytics.writer import async_writer, event_writer
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class StatsdEmitter(object):
+    """Fire-and-forget statsd timings over UDP"""
+
+    def __init__(self, host, port, prefix):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = None
+
+    def timing(self, name, milliseconds):
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._socket.setblocking(False)
+            self._socket.sendto(('%s.%s:%.3f|ms' % (self.prefix, name, milliseconds)).encode(), self.address)
+        except OSError:
+            # statsd being unreachable must never cost a request
+            pass
+
+
+class PhaseMetrics(object):
+    def __init__(self, enabled=TRACK_METRICS, reservoir_size=TRACK_METRICS_RESERVOIR_SIZE, emitter=None):
+        self.enabled = enabled
+        self.reservoir_size = reservoir_size
+        self.emitter = emitter
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._phases = {}
+
+    def record(self, phase, seconds):
+        with self._lock:
+            if phase not in self._phases:
+                self._phases[phase] = [0, 0.0, deque(maxlen=self.reservoir_size)]
+            entry = self._phases[phase]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2].append(seconds)
+        if self.emitter is not None:
+            self.emitter.timing(phase, seconds * 1000)
+
+    @contextmanager
+    def timer(self, phase):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def snapshot(self):
+        """{phase: {count, total_ms, mean_ms, p50_ms, p95_ms, p99_ms}}"""
+        with self._lock:
+            phases = {phase: (count, total, sorted(durations)) for phase, (count, total, durations) in self._phases.items()}
+        return {
+            phase: {
+                'count': count,
+                'total_ms': total * 1000,
+                'mean_ms': total / count * 1000,
+                'p50_ms': percentile(durations, 0.50) * 1000,
+                'p95_ms': percentile(durations, 0.95) * 1000,
+                'p99_ms': percentile(durations, 0.99) * 1000,
+            }
+            for phase, (count, total, durations) in phases.items()
+        }
+
+
+metrics = PhaseMetrics(
+    emitter=StatsdEmitter(TRACK_STATSD_HOST, TRACK_STATSD_PORT, TRACK_STATSD_PREFIX) if TRACK_STATSD_HOST else None,
+)
+
+
+def watchman_check():
+    """django-watchman check with the phase timings, the caches and the writer backlogs of this process"""
+    return {
+        'analytics': {
+            'ok': True,
+            'phases': metrics.snapshot(),
+            'caches': {'location': location_cache_info(), 'user_agent': user_agent_cache_info()},
+            'writer': {'queued': event_writer.qsize(), 'written': event_writer.written, 'dropped': event_writer.dropped},
+            'async_writer': {
+                'pending': async_writer.pending(), 'written': async_writer.written, 'dropped': async_writer.dropped,
+            },
+            'spool': {'appended': spool_writer.appended, 'dropped': spool_writer.dropped},
+        },
+    }
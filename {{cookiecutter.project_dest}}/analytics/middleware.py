@@ -1,28 +1,47 @@
+import asyncio
+import json
 import logging
 import re
 import warnings
 
-from django.contrib.gis.geoip2 import GeoIP2, GeoIP2Exception
 from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
 from django.utils.encoding import smart_text
+from django.utils.functional import LazyObject, empty
 
 # third party
+from analytics.devices import DEVICE_TYPES, get_user_agent
+from analytics.geo import UNKNOWN_LOCATION, lookup_location
+from analytics.headers import filter_headers, filter_params, header_sets
+from analytics.matching import IgnoreMatcher
+from analytics.metrics import metrics
 from analytics.models import Visitor, WebEvent
+from analytics.sampling import sampler
 from analytics.settings import (
-    TRACK_AJAX_REQUESTS, TRACK_ANONYMOUS_USERS, TRACK_IGNORE_STATUS_CODES,
-    TRACK_IGNORE_URLS, TRACK_IGNORE_USER_AGENTS, TRACK_PAGEVIEWS,
+    TRACK_AJAX_REQUESTS, TRACK_ANONYMOUS_USERS, TRACK_BOTS,
+    TRACK_IGNORE_CACHE_SIZE, TRACK_IGNORE_STATUS_CODES,
+    TRACK_IGNORE_URLS, TRACK_IGNORE_USER_AGENTS,
+    TRACK_PAGEVIEWS, TRACK_VISITOR_UPSERT, TRACK_WRITE_MODE,
 )
-from analytics.utils import total_seconds
-from geoip2.errors import GeoIP2Error
+from analytics.snapshots import session_snapshots
+from analytics.spool import spool_writer
+from analytics.utils import total_seconds, update_visitor
+from analytics.visitors import visitor_cache
+from analytics.writer import EventRecord, async_writer, event_writer
 from ipware.ip import get_real_ip
 
 
-track_ignore_urls = [re.compile(x) for x in TRACK_IGNORE_URLS]
-track_ignore_user_agents = [
-    re.compile(x, re.IGNORECASE) for x in TRACK_IGNORE_USER_AGENTS
-]
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:  # Django < 3.0, no async support anyway
+    sync_to_async = None
+
+
+track_ignore_urls = IgnoreMatcher(TRACK_IGNORE_URLS)
+track_ignore_user_agents = IgnoreMatcher(
+    TRACK_IGNORE_USER_AGENTS, flags=re.IGNORECASE, cache_size=TRACK_IGNORE_CACHE_SIZE,
+)
 
 logger = logging.getLogger('analytics')
 
@@ -31,10 +50,6 @@ class UnSupportedMethodException(Exception):
     pass
 
 
-def remap_keys(mapping):
-    return [{'key': k, 'value': mapping[k]} for k in mapping]
-
-
 class VisitorTrackingMiddleware(MiddlewareMixin):
     def _should_track(self, user, request, response):
         # Session framework not installed, nothing to see here..
@@ -61,60 +76,100 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
             return False
 
         # Do not track ignored urls
-        path = request.path_info.lstrip('/')
-        for url in track_ignore_urls:
-            if url.match(path):
-                return False
+        if track_ignore_urls(request.path_info.lstrip('/')):
+            return False
 
         # Do not track ignored user agents
-        user_agent = request.META.get('HTTP_USER_AGENT', '')
-        for user_agent_pattern in track_ignore_user_agents:
-            if user_agent_pattern.match(user_agent):
-                return False
+        if track_ignore_user_agents(request.META.get('HTTP_USER_AGENT', '')):
+            return False
+
+        # Do not track bots unless specified otherwise
+        if not TRACK_BOTS and get_user_agent(request).device_type == DEVICE_TYPES.BOT:
+            return False
 
         # everything says we should track this hit
         return True
 
+    def _get_visitor_values(self, user, request):
+        values = {
+            # Log the landing url, only used when the Visitor is created
+            'landing_url': request.build_absolute_uri()[:Visitor._meta.get_field('landing_url').max_length],
+            'expiry_age': request.session.get_expiry_age(),
+            'expiry_time': request.session.get_expiry_date(),
+            # JSON encoded, None when the session didn't change since it was last written
+            'data': session_snapshots.capture(request.session),
+        }
+        if user:
+            values['user_id'] = user.id
+
+        user_agent = request.META.get('HTTP_USER_AGENT', None)
+        if user_agent:
+            values['user_agent'] = smart_text(
+                user_agent, encoding='latin-1', errors='ignore')
+        return values
+
     def _refresh_visitor(self, user, request, visit_time):
+        """Creates or updates the Visitor of this session and returns its id"""
+        if TRACK_VISITOR_UPSERT:
+            return self._upsert_visitor(user, request, visit_time)
+        return self._save_visitor(user, request, visit_time)
+
+    def _upsert_visitor(self, user, request, visit_time):
+        session_key = request.session.session_key
+        values = self._get_visitor_values(user, request)
+
+        if visitor_cache.enabled:
+            key = visitor_cache.get(session_key)
+            if key is not None and self._update_visitor(key, values, visit_time):
+                session_snapshots.remember(session_key, values['data'])
+                return key.id
+
+        key = Visitor.objects.upsert(session_key, visit_time, values)
+        if visitor_cache.enabled:
+            visitor_cache.set(session_key, key)
+        session_snapshots.remember(session_key, values['data'])
+        return key.id
+
+    def _update_visitor(self, key, values, visit_time):
+        """UPDATEs only the columns a later hit changes, False when the Visitor is gone"""
+        fields = {
+            'modified': visit_time,
+            'expiry_age': values['expiry_age'],
+            'expiry_time': values['expiry_time'],
+            'time_on_site': max(0, int(total_seconds(visit_time - key.created))),
+        }
+        if values.get('user_id'):
+            fields['user_id'] = values['user_id']
+        if values.get('user_agent'):
+            fields['user_agent'] = values['user_agent']
+        if values['data'] is not None:
+            fields['data'] = json.loads(values['data'])
+        return bool(Visitor.objects.filter(pk=key.id).update(**fields))
+
+    def _save_visitor(self, user, request, visit_time):
         # A Visitor row is unique by session_key
         session_key = request.session.session_key
+        values = self._get_visitor_values(user, request)
 
         try:
             visitor = Visitor.objects.get(session_key=session_key)
         except Visitor.DoesNotExist:
-            # Log the ip address. Start time is managed via the field
-            # `default` value
-            visitor = Visitor(session_key=session_key, created=visit_time)
-            visitor.landing_url = request.build_absolute_uri()[:Visitor._meta.get_field('landing_url').max_length]
-
-        # Update the user field if the visitor user is not set. This
-        # implies authentication has occured on this request and now
-        # the user is object exists. Check using `user_id` to prevent
-        # a database hit.
-
-        if user and visitor.user_id != user.id:
-            visitor.user_id = user.id
-
-        # update some session expiration details
-        visitor.expiry_age = request.session.get_expiry_age()
-        visitor.expiry_time = request.session.get_expiry_date()
-
-        # grab the latest User-Agent and store it
-        user_agent = request.META.get('HTTP_USER_AGENT', None)
-        if user_agent:
-            visitor.user_agent = smart_text(
-                user_agent, encoding='latin-1', errors='ignore')
-
-        time_on_site = 0
-        if visitor.created:
-            time_on_site = total_seconds(visit_time - visitor.created)
-        visitor.time_on_site = int(time_on_site)
-        visitor.data = remap_keys(dict(request.session.items()))
-        visitor.modified = visit_time
+            # Start time is managed via the field `default` value
+            visitor = Visitor(session_key=session_key, created=visit_time, landing_url=values['landing_url'])
+
+        update_visitor(visitor, values, visit_time)
+        update_fields = None
+        if values['data'] is None and visitor.pk:
+            # leave the stored session data alone
+            update_fields = [
+                field.name for field in Visitor._meta.concrete_fields
+                if not field.primary_key and field.name != 'data'
+            ]
 
         try:
             with transaction.atomic():
-                visitor.save()
+                visitor.save(update_fields=update_fields)
+            session_snapshots.remember(session_key, values['data'])
         except IntegrityError:
             # there is a small chance a second response has saved this
             # Visitor already and a second save() at the same time (having
@@ -123,9 +178,13 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
             # If this happens we'll just grab the "winner" and use that!
             visitor = Visitor.objects.get(session_key=session_key)
 
-        return visitor
+        return visitor.pk
 
-    def _add_webevent(self, visitor, request, view_time, response_data, status_code):
+    def _get_sample_weight(self, request):
+        url_name = request.resolver_match.view_name if request.resolver_match else ''
+        return sampler.sample(url_name, get_user_agent(request).device_type)
+
+    def _get_webevent_values(self, request, response_data, status_code, sample_weight=1):
         if request.method.upper() == 'GET':
             method = WebEvent.METHOD_TYPES.GET
         elif request.method.upper() == 'POST':
@@ -133,44 +192,20 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
         else:
             raise UnSupportedMethodException('Method not supported', request.method)
 
-        if hasattr(request, 'user_agent'):
-            device_type = {
-                request.user_agent.is_mobile: WebEvent.DEVICE_TYPES.MOBILE,
-                request.user_agent.is_tablet: WebEvent.DEVICE_TYPES.TABLET,
-                request.user_agent.is_pc: WebEvent.DEVICE_TYPES.PC,
-                request.user_agent.is_bot: WebEvent.DEVICE_TYPES.BOT,
-            }.get(True, WebEvent.DEVICE_TYPES.UNKNOWN)
-            browser = request.user_agent.browser.family
-            browser_version = request.user_agent.browser.version_string
-            os = request.user_agent.os.family
-            os_version = request.user_agent.os.version_string
-            device_model = request.user_agent.device.family
-        else:
-            device_type = WebEvent.DEVICE_TYPES.UNKNOWN
-            browser = ''
-            browser_version = ''
-            os = ''
-            os_version = ''
-            device_model = ''
-
-        city = {}
+        with metrics.timer('user_agent'):
+            user_agent = get_user_agent(request)
 
         # Get the IP address and so the geographical info, if available.
         ip_address = get_real_ip(request) or ''
         if not ip_address:
             logger.debug(
                 'Could not determine IP address for request %s', request)
+            country, region, city = UNKNOWN_LOCATION
         else:
-            try:
-                geo = GeoIP2()
-            except (GeoIP2Error, GeoIP2Exception):
-                logger.exception(
-                    'Unable to determine geolocation for address %s', ip_address)
-            else:
-                city = geo.city(ip_address)
+            with metrics.timer('geoip'):
+                country, region, city = lookup_location(ip_address)
 
-        data = dict(getattr(request, request.method.upper(), {}))
-        data.pop('csrfmiddlewaretoken', None)  # Dirty hack
+        data = filter_params(getattr(request, request.method.upper()))
 
         if request.resolver_match:
             url_name = request.resolver_match.view_name
@@ -179,8 +214,7 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
             url_name = ''
             url_kwargs = ''
 
-        WebEvent.objects.create(
-            visitor=visitor,
+        return dict(
             data=data,
             # Sometimes the url can be huge, an easy way to break the site.
             url=request.build_absolute_uri()[:WebEvent._meta.get_field('url').max_length],
@@ -190,19 +224,40 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
             response_data=response_data,
             status_code=status_code,
             referrer=request.META.get('HTTP_REFERER', '')[:WebEvent._meta.get_field('referrer').max_length],
-            browser=browser,
-            browser_version=browser_version,
-            os=os,
-            os_version=os_version,
-            device_model=device_model,
-            device_type=device_type,
+            browser=user_agent.browser,
+            browser_version=user_agent.browser_version,
+            os=user_agent.os,
+            os_version=user_agent.os_version,
+            device_model=user_agent.device_model,
+            device_type=user_agent.device_type,
             ip_address=ip_address,
-            ip_country=city.get('country_code', '') or '',
-            ip_region=city.get('region', '') or '',
-            ip_city=city.get('city', '') or '',
+            ip_country=country,
+            ip_region=region,
+            ip_city=city,
+            sample_weight=sample_weight,
         )
 
-    def process_response(self, request, response):
+    def _add_webevent(self, visitor_id, request, view_time, response_data, status_code, sample_weight=1):
+        values = self._get_webevent_values(request, response_data, status_code, sample_weight)
+        WebEvent.objects.create(
+            visitor_id=visitor_id,
+            created=view_time,
+            **header_sets.intern([values])[0],
+        )
+
+    def _capture(self, user, request, response, visit_time, sample_weight=1):
+        """Captures everything the writer needs to record this hit later on"""
+        return EventRecord(
+            session_key=request.session.session_key,
+            visit_time=visit_time,
+            visitor=self._get_visitor_values(user, request),
+            event=self._get_webevent_values(
+                request, response_data=filter_headers(response.items()), status_code=response.status_code,
+                sample_weight=sample_weight,
+            ) if TRACK_PAGEVIEWS else None,
+        )
+
+    def _get_user(self, request):
         # If dealing with a non-authenticated user, we still should track the
         # session since if authentication happens, the `session_key` carries
         # over, thus having a more accurate start time of session
@@ -210,24 +265,105 @@ class VisitorTrackingMiddleware(MiddlewareMixin):
         if user and user.is_anonymous:
             # set AnonymousUsers to None for simplicity
             user = None
+        return user
+
+    def _record(self, user, request, response, visit_time, sample_weight):
+        if TRACK_WRITE_MODE in ('async', 'spool'):
+            with metrics.timer('capture'):
+                record = self._capture(user, request, response, visit_time, sample_weight)
+            with metrics.timer('submit'):
+                if TRACK_WRITE_MODE == 'async':
+                    # leave the database work to the background writer
+                    event_writer.submit(record)
+                else:
+                    # a local append, drain_spool ships it to the database
+                    spool_writer.append(record)
+            return
 
-        # make sure this is a response we want to track
-        if not self._should_track(user, request, response):
-            return response
+        # update/create the visitor object for this request
+        with metrics.timer('visitor'):
+            visitor_id = self._refresh_visitor(user, request, visit_time)
+
+        if TRACK_PAGEVIEWS:
+            with metrics.timer('webevent'):
+                self._add_webevent(
+                    visitor_id, request, visit_time,
+                    response_data=filter_headers(response.items()), status_code=response.status_code,
+                    sample_weight=sample_weight,
+                )
+
+    def process_response(self, request, response):
+        with metrics.timer('total'):
+            self._process_response(request, response)
+        return response
+
+    def _process_response(self, request, response):
+        user = self._get_user(request)
+
+        with metrics.timer('decide'):
+            # make sure this is a response we want to track
+            if not self._should_track(user, request, response):
+                return
+
+            # leave hits out of the sample before doing any database work
+            sample_weight = self._get_sample_weight(request)
+            if sample_weight is None:
+                return
 
         # Force a save to generate a session key if one does not exist
         if not request.session.session_key:
-            request.session.save()
+            with metrics.timer('session_save'):
+                request.session.save()
 
         # Be conservative with the determining time on site since simply
         # increasing the session timeout could greatly skew results. This
         # is the only time we can guarantee.
         now = timezone.now()
 
-        # update/create the visitor object for this request
-        visitor = self._refresh_visitor(user, request, now)
+        self._record(user, request, response, now, sample_weight)
 
-        if TRACK_PAGEVIEWS:
-            self._add_webevent(visitor, request, now, response_data=dict(response.items()), status_code=response.status_code)
 
+class AsyncVisitorTrackingMiddleware(VisitorTrackingMiddleware):
+    """
+    VisitorTrackingMiddleware for ASGI: the tracking decision is made on the
+    event loop and the database work is handed to `async_writer` without
+    waiting for it. Under WSGI it's the plain synchronous middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        self._async_mode = (
+            get_response is not None and sync_to_async is not None and asyncio.iscoroutinefunction(get_response)
+        )
+
+    def __call__(self, request):
+        if self._async_mode:
+            return self._acall(request)
+        return super().__call__(request)
+
+    async def _aget_user(self, request):
+        user = getattr(request, 'user', None)
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            # resolving the user reads the session and the database
+            return await sync_to_async(self._get_user)(request)
+        return self._get_user(request)
+
+    async def _acall(self, request):
+        response = await self.get_response(request)
+
+        user = await self._aget_user(request)
+        if not self._should_track(user, request, response):
+            return response
+
+        sample_weight = self._get_sample_weight(request)
+        if sample_weight is None:
+            return response
+
+        # the session key is needed before the response sets the cookie
+        if not request.session.session_key:
+            await sync_to_async(request.session.save)()
+
+        async_writer.schedule(self._record, user, request, response, timezone.now(), sample_weight)
         return response
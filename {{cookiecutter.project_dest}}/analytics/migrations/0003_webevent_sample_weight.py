@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_created_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webevent',
+            name='sample_weight',
+            field=models.FloatField(default=1),
+        ),
+    ]
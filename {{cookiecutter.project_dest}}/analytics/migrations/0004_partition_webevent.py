@@ -0,0 +1,54 @@
+from django.db import migrations
+
+
+def get_tables(apps):
+    # the historical models, so that later changes of WebEvent don't reach this migration
+    WebEvent = apps.get_model('analytics', 'WebEvent')
+    return WebEvent._meta.db_table, WebEvent._meta.get_field('visitor').related_model._meta.db_table
+
+
+def add_legacy_check(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # third party
+    from analytics.partitions import add_legacy_check
+
+    add_legacy_check(schema_editor.connection, table=get_tables(apps)[0])
+
+
+def validate_legacy_check(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # third party
+    from analytics.partitions import validate_legacy_check
+
+    validate_legacy_check(schema_editor.connection, table=get_tables(apps)[0])
+
+
+def partition_webevent(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # third party
+    from analytics.partitions import partition_table
+    from analytics.settings import TRACK_WEBEVENT_PARTITIONS_AHEAD
+
+    table, visitor_table = get_tables(apps)
+    partition_table(
+        schema_editor.connection, TRACK_WEBEVENT_PARTITIONS_AHEAD, table=table, visitor_table=visitor_table,
+    )
+
+
+class Migration(migrations.Migration):
+    # Each step commits on its own: the validation scan must not run under
+    # the ACCESS EXCLUSIVE lock the partitioning takes
+    atomic = False
+
+    dependencies = [
+        ('analytics', '0003_webevent_sample_weight'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_legacy_check, atomic=True),
+        migrations.RunPython(validate_legacy_check, atomic=True),
+        migrations.RunPython(partition_webevent, atomic=True),
+    ]
@@ -0,0 +1,32 @@
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_partition_webevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='webevent',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created'], name='webevent_created_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='webevent',
+            index=models.Index(fields=['url_name', 'created'], name='webevent_url_name_created'),
+        ),
+        migrations.AddIndex(
+            model_name='webevent',
+            index=models.Index(fields=['visitor', 'created'], name='webevent_visitor_created'),
+        ),
+        migrations.AddIndex(
+            model_name='webevent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['marketing_params'], name='webevent_marketing_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='webevent',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['url_kwargs'], name='webevent_url_kwargs_gin'),
+        ),
+    ]
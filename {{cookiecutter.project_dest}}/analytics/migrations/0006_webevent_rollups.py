@@ -0,0 +1,55 @@
+from django.db import migrations, models
+import django_countries.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_webevent_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupHighWaterMark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WebEventDailyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(max_length=100)),
+                ('device_type', models.CharField(choices=[('PC', 'PC'), ('MOBILE', 'MOBILE'), ('TABLET', 'TABLET'), ('BOT', 'BOT'), ('UNKNOWN', 'UNKNOWN')], max_length=10)),
+                ('ip_country', django_countries.fields.CountryField(max_length=2)),
+                ('status_code', models.IntegerField()),
+                ('events', models.IntegerField(default=0)),
+                ('hits', models.FloatField(default=0)),
+                ('period', models.DateField()),
+            ],
+            options={
+                'ordering': ['period'],
+                'unique_together': {('period', 'url_name', 'device_type', 'ip_country', 'status_code')},
+            },
+        ),
+        migrations.CreateModel(
+            name='WebEventHourlyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(max_length=100)),
+                ('device_type', models.CharField(choices=[('PC', 'PC'), ('MOBILE', 'MOBILE'), ('TABLET', 'TABLET'), ('BOT', 'BOT'), ('UNKNOWN', 'UNKNOWN')], max_length=10)),
+                ('ip_country', django_countries.fields.CountryField(max_length=2)),
+                ('status_code', models.IntegerField()),
+                ('events', models.IntegerField(default=0)),
+                ('hits', models.FloatField(default=0)),
+                ('period', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['period'],
+                'unique_together': {('period', 'url_name', 'device_type', 'ip_country', 'status_code')},
+            },
+        ),
+    ]
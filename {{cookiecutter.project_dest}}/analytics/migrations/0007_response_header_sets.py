@@ -0,0 +1,26 @@
+import django.contrib.postgres.fields.hstore
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_webevent_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseHeaderSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('headers', django.contrib.postgres.fields.hstore.HStoreField(default=dict)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='webevent',
+            name='response_headers',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='analytics.ResponseHeaderSet'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_response_header_sets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rolluphighwatermark',
+            name='last_xid',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rolluphighwatermark',
+            name='pending_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='rolluphighwatermark',
+            name='pending_xid',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
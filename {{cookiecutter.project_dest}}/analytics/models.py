@@ -1,11 +1,14 @@
 import logging
+from collections import namedtuple
 
 from django.conf import settings
 from django.contrib.postgres import fields as pg_fields
-from django.db import models
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.db import connections, models, router
 from django.utils import timezone
 
 # third party
+from analytics.devices import DEVICE_TYPES
 from common.forms import DjangoQuerysetJSONEncoder
 from django_countries.fields import CountryField
 # GEOIP_CACHE_TYPE = getattr(settings, 'GEOIP_CACHE_TYPE', 4)
@@ -21,15 +24,87 @@ from model_utils import Choices
 
 log = logging.getLogger(__file__)
 
+# What the middleware needs to know about a stored Visitor to update it
+VisitorKey = namedtuple('VisitorKey', ('id', 'created', 'landing_url'))
+
 
 class TimeTrackedModel(models.Model):
-    created = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, rows written in batches keep the time of the visit
+    created = models.DateTimeField(default=timezone.now, editable=False)
     modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         abstract = True
 
 
+class VisitorManager(models.Manager):
+    # `time_on_site` of an existing row is computed against the `created` of
+    # the first insert, `created` and `landing_url` are never updated and the
+    # stored `data` of the session keys listed last is kept, as still current
+    UPSERT_SQL = '''
+        INSERT INTO {table} (
+            session_key, created, modified, landing_url, expiry_age,
+            expiry_time, time_on_site, user_agent, data, user_id
+        )
+        VALUES {values}
+        ON CONFLICT (session_key) DO UPDATE SET
+            modified = EXCLUDED.modified,
+            expiry_age = EXCLUDED.expiry_age,
+            expiry_time = EXCLUDED.expiry_time,
+            time_on_site = GREATEST(0, TRUNC(EXTRACT(EPOCH FROM EXCLUDED.modified - {table}.created)))::integer,
+            user_agent = COALESCE(EXCLUDED.user_agent, {table}.user_agent),
+            data = CASE WHEN EXCLUDED.session_key = ANY(%s::text[]) THEN {table}.data ELSE EXCLUDED.data END,
+            user_id = COALESCE(EXCLUDED.user_id, {table}.user_id)
+        RETURNING session_key, id, created, landing_url
+    '''
+    # a new Visitor of unchanged data (None) gets an empty dict
+    UPSERT_VALUES_SQL = "(%s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s::jsonb, '{}'::jsonb), %s)"
+
+    def bulk_upsert(self, visitors, using=None):
+        """
+        Inserts or updates visitors in a single statement, `visitors` maps a
+        session_key to (first visit_time, last visit_time, values) where values
+        are the ones captured by the middleware, with `data` already JSON
+        encoded or None to keep the stored one.
+        Returns {session_key: visitor id}
+        """
+        return {session_key: key.id for session_key, key in self.bulk_upsert_keys(visitors, using).items()}
+
+    def bulk_upsert_keys(self, visitors, using=None):
+        """Same as `bulk_upsert`, returns {session_key: VisitorKey}"""
+        if not visitors:
+            return {}
+        params = []
+        # A stable order keeps concurrent upserts from deadlocking each other
+        for session_key, (first_time, last_time, values) in sorted(visitors.items()):
+            params.extend([
+                session_key,
+                first_time,
+                last_time,
+                values['landing_url'],
+                values['expiry_age'],
+                values['expiry_time'],
+                int((last_time - first_time).total_seconds()),
+                values.get('user_agent') or None,
+                values['data'],
+                values.get('user_id') or None,
+            ])
+        params.append([session_key for session_key, (_, _, values) in visitors.items() if values['data'] is None])
+
+        connection = connections[using or router.db_for_write(self.model)]
+        sql = self.UPSERT_SQL.format(
+            table=connection.ops.quote_name(self.model._meta.db_table),
+            values=', '.join([self.UPSERT_VALUES_SQL] * len(visitors)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {row[0]: VisitorKey(*row[1:]) for row in cursor.fetchall()}
+
+    def upsert(self, session_key, visit_time, values):
+        """Records one hit of `session_key` and returns its VisitorKey"""
+        return self.bulk_upsert_keys({session_key: (visit_time, visit_time, values)})[session_key]
+
+
 class Visitor(TimeTrackedModel):
     session_key = models.CharField(max_length=40, unique=True)
     user = models.ForeignKey(
@@ -46,6 +121,8 @@ class Visitor(TimeTrackedModel):
     user_agent = models.TextField(null=True, editable=False)
     data = pg_fields.JSONField(default=dict, encoder=DjangoQuerysetJSONEncoder)
 
+    objects = VisitorManager()
+
     def __str__(self):
         return f'{self.session_key} - {self.user}'
 
@@ -65,19 +142,51 @@ class Visitor(TimeTrackedModel):
         ordering = ('-created',)
 
 
+class ResponseHeaderSetManager(models.Manager):
+    UPSERT_SQL = '''
+        INSERT INTO {table} (digest, headers)
+        VALUES {values}
+        ON CONFLICT (digest) DO UPDATE SET digest = EXCLUDED.digest
+        RETURNING digest, id
+    '''
+
+    def get_ids(self, header_sets, using=None):
+        """Stores the missing header sets of {digest: headers}, returns {digest: id}"""
+        if not header_sets:
+            return {}
+        params = []
+        # A stable order keeps concurrent upserts from deadlocking each other
+        for digest, headers in sorted(header_sets.items()):
+            params.extend([digest, headers])
+
+        connection = connections[using or router.db_for_write(self.model)]
+        sql = self.UPSERT_SQL.format(
+            table=connection.ops.quote_name(self.model._meta.db_table),
+            values=', '.join(['(%s, %s)'] * len(header_sets)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return dict(cursor.fetchall())
+
+
+class ResponseHeaderSet(models.Model):
+    """A distinct set of response headers, shared by the web events that got it"""
+    digest = models.CharField(max_length=40, unique=True)
+    headers = pg_fields.HStoreField(default=dict)
+
+    objects = ResponseHeaderSetManager()
+
+    def __str__(self):
+        return self.digest
+
+
 class WebEvent(TimeTrackedModel):
     modified = None
     METHOD_TYPES = Choices(
         'GET',
         'POST',
     )
-    DEVICE_TYPES = Choices(
-        'PC',
-        'MOBILE',
-        'TABLET',
-        'BOT',
-        'UNKNOWN',
-    )
+    DEVICE_TYPES = DEVICE_TYPES
     visitor = models.ForeignKey('Visitor', on_delete=models.PROTECT)
     data = pg_fields.JSONField(default=dict, encoder=DjangoQuerysetJSONEncoder)
     marketing_params = pg_fields.HStoreField(default=dict)
@@ -85,7 +194,10 @@ class WebEvent(TimeTrackedModel):
     url = models.URLField(max_length=2048)
     url_kwargs = pg_fields.HStoreField(default=dict)
     url_name = models.CharField(max_length=100)
+    # the per response headers (TRACK_RESPONSE_VALUE_HEADERS) next to `response_headers`,
+    # all of them for the events recorded before it
     response_data = pg_fields.HStoreField(default=dict)
+    response_headers = models.ForeignKey('ResponseHeaderSet', null=True, editable=False, on_delete=models.PROTECT)
     status_code = models.IntegerField()
     method = models.CharField(max_length=6, choices=METHOD_TYPES)
 
@@ -102,8 +214,75 @@ class WebEvent(TimeTrackedModel):
     ip_region = models.CharField(max_length=255)
     ip_city = models.CharField(max_length=255)
 
+    # number of hits this event stands for when tracking is sampled
+    sample_weight = models.FloatField(default=1)
+
     def __str__(self):
         return f'{self.visitor_id} - {self.method} - {self.url_name}'
 
+    @property
+    def headers(self):
+        """Response headers of the event, wherever they're stored"""
+        if self.response_headers_id:
+            return dict(self.response_headers.headers, **self.response_data)
+        return self.response_data
+
     class Meta:
         ordering = ['created']
+        indexes = [
+            # events are inserted in `created` order, a BRIN index stays tiny
+            BrinIndex(fields=['created'], name='webevent_created_brin'),
+            models.Index(fields=['url_name', 'created'], name='webevent_url_name_created'),
+            models.Index(fields=['visitor', 'created'], name='webevent_visitor_created'),
+            GinIndex(fields=['marketing_params'], name='webevent_marketing_gin'),
+            GinIndex(fields=['url_kwargs'], name='webevent_url_kwargs_gin'),
+        ]
+
+
+class WebEventRollup(models.Model):
+    """Web events counted per period and dimensions, kept up to date by `rollup_webevents`"""
+    url_name = models.CharField(max_length=100)
+    device_type = models.CharField(max_length=10, choices=DEVICE_TYPES)
+    ip_country = CountryField()
+    status_code = models.IntegerField()
+    # raw rows, and the hits they stand for once `sample_weight` is applied
+    events = models.IntegerField(default=0)
+    hits = models.FloatField(default=0)
+
+    DIMENSIONS = ('url_name', 'device_type', 'ip_country', 'status_code')
+
+    class Meta:
+        abstract = True
+
+
+class WebEventDailyRollup(WebEventRollup):
+    # day in settings.TIME_ZONE
+    period = models.DateField()
+
+    class Meta:
+        unique_together = ('period', 'url_name', 'device_type', 'ip_country', 'status_code')
+        ordering = ['period']
+
+
+class WebEventHourlyRollup(WebEventRollup):
+    period = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('period', 'url_name', 'device_type', 'ip_country', 'status_code')
+        ordering = ['period']
+
+
+class RollupHighWaterMark(models.Model):
+    """How far the WebEvents are folded into the rollups, see analytics.rollups"""
+    name = models.CharField(max_length=50, unique=True)
+    # every event of an id up to it is folded
+    last_id = models.BigIntegerField(default=0)
+    # every event inserted by a transaction (txid) below it is folded
+    last_xid = models.BigIntegerField(default=0)
+    # last_id to be, once the transactions up to pending_xid are over
+    pending_id = models.BigIntegerField(null=True)
+    pending_xid = models.BigIntegerField(null=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} - {self.last_id}'
@@ -0,0 +1,225 @@
+"""
+Monthly range partitions of the WebEvent table on `created`.
+
+The table is turned into a partitioned one by the 0004 migration: the rows
+that existed by then stay in a `<table>_legacy` partition, which also takes
+the current and the next month, every later month gets its own
+`<table>_pYYYYMM` partition and a `<table>_default` partition catches rows
+for months that haven't been created yet.
+"""
+import datetime
+import re
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+# third party
+from analytics.models import WebEvent
+
+
+BOUND_RE = re.compile(r"FROM \((?P<lower>[^)]+)\) TO \((?P<upper>[^)]+)\)")
+
+
+def month_start(date):
+    return datetime.datetime(date.year, date.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(date, months):
+    month = date.month - 1 + months
+    return date.replace(year=date.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def get_table():
+    return WebEvent._meta.db_table
+
+
+def get_partition_name(month, table=None):
+    return '{table}_p{month:%Y%m}'.format(table=table or get_table(), month=month)
+
+
+def _parse_bound(bound):
+    bound = bound.strip().strip("'")
+    return None if bound.upper() in ('MINVALUE', 'MAXVALUE') else parse_datetime(bound)
+
+
+def list_partitions(connection, table=None):
+    """Returns [(name, lower bound, upper bound)] with None for unbounded ends, default partition excluded"""
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+        ''', [table or get_table()])
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_RE.search(bound)
+        if match:
+            partitions.append((name, _parse_bound(match.group('lower')), _parse_bound(match.group('upper'))))
+    return sorted(partitions, key=lambda partition: partition[2] or datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
+
+
+def create_partition(connection, month, table=None):
+    """
+    Creates the partition of `month`, moving the rows the default partition
+    holds for it (if any) into the new partition.
+    """
+    table = table or get_table()
+    qn = connection.ops.quote_name
+    name = get_partition_name(month, table)
+    lower, upper = month, add_months(month, 1)
+    default = '%s_default' % table
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM {default} WHERE created >= %s AND created < %s LIMIT 1'.format(
+            default=qn(default),
+        ), [lower, upper])
+        misplaced = cursor.fetchone() is not None
+        if misplaced:
+            cursor.execute('ALTER TABLE {table} DETACH PARTITION {default}'.format(table=qn(table), default=qn(default)))
+
+        cursor.execute('CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)'.format(
+            name=qn(name), table=qn(table),
+        ), [lower, upper])
+
+        if misplaced:
+            cursor.execute('''
+                WITH moved AS (DELETE FROM {default} WHERE created >= %s AND created < %s RETURNING *)
+                INSERT INTO {table} SELECT * FROM moved
+            '''.format(default=qn(default), table=qn(table)), [lower, upper])
+            cursor.execute('ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT'.format(table=qn(table), default=qn(default)))
+    return name
+
+
+def ensure_partitions(connection, months_ahead, now=None, table=None):
+    """Creates the missing partitions from the current month to `months_ahead` months later"""
+    partitions = list_partitions(connection, table)
+    current = month_start(now or datetime.datetime.now(datetime.timezone.utc))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if any(
+            (lower is None or lower <= month) and (upper is None or month < upper)
+            for name, lower, upper in partitions
+        ):
+            # already covered, by its own partition or the legacy one
+            continue
+        created.append(create_partition(connection, month, table))
+    return created
+
+
+def expire_partitions(connection, retention_months, drop=False, now=None, table=None):
+    """Detaches (or drops) the partitions holding only events older than `retention_months`"""
+    table = table or get_table()
+    qn = connection.ops.quote_name
+    cutoff = add_months(month_start(now or datetime.datetime.now(datetime.timezone.utc)), -retention_months)
+    expired = []
+    for name, lower, upper in list_partitions(connection, table):
+        if upper is None or upper > cutoff:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE {table} DETACH PARTITION {name}'.format(table=qn(table), name=qn(name)))
+            if drop:
+                cursor.execute('DROP TABLE {name}'.format(name=qn(name)))
+        expired.append(name)
+    return expired
+
+
+def get_legacy_bound(now=None):
+    """Upper bound of the legacy partition, far enough for the migration steps to span a month end"""
+    return add_months(month_start(now or datetime.datetime.now(datetime.timezone.utc)), 2)
+
+
+def get_legacy_check(table):
+    return '%s_legacy_created_check' % table
+
+
+def add_legacy_check(connection, now=None, table=None):
+    """
+    Adds the NOT VALID CHECK constraint bounding `created` of the rows of the
+    plain table, if it's missing. It takes no scan, the table is locked briefly.
+    """
+    table = table or get_table()
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_constraint WHERE conname = %s', [get_legacy_check(table)])
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute('''
+            ALTER TABLE {table} ADD CONSTRAINT {constraint}
+            CHECK (created IS NOT NULL AND created < %s) NOT VALID
+        '''.format(table=qn(table), constraint=qn(get_legacy_check(table))), [get_legacy_bound(now)])
+
+
+def validate_legacy_check(connection, table=None):
+    """
+    Validates the constraint of `add_legacy_check`. It scans the table but
+    only holds a SHARE UPDATE EXCLUSIVE lock, so reads and writes go on as
+    long as it runs in a transaction of its own.
+    """
+    table = table or get_table()
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT convalidated FROM pg_constraint WHERE conname = %s', [get_legacy_check(table)])
+        row = cursor.fetchone()
+        if row is None or row[0]:
+            return
+        cursor.execute('ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}'.format(
+            table=qn(table), constraint=qn(get_legacy_check(table)),
+        ))
+
+
+def partition_table(connection, months_ahead, now=None, table=None, visitor_table=None):
+    """
+    Turns the plain WebEvent table into a table partitioned by month on
+    `created`. ATTACH PARTITION only skips its scan of the table, under the
+    ACCESS EXCLUSIVE lock of the RENAME, when the legacy check was validated
+    beforehand in a transaction of its own (see the 0004 migration).
+    """
+    table = table or get_table()
+    visitor_table = visitor_table or WebEvent._meta.get_field('visitor').related_model._meta.db_table
+    qn = connection.ops.quote_name
+    legacy = '%s_legacy' % table
+    bound = get_legacy_bound(now)
+
+    add_legacy_check(connection, now=now, table=table)
+    validate_legacy_check(connection, table=table)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+        sequence, = cursor.fetchone()
+        cursor.execute('ALTER TABLE {table} RENAME TO {legacy}'.format(table=qn(table), legacy=qn(legacy)))
+        cursor.execute('''
+            CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)
+            PARTITION BY RANGE (created)
+        '''.format(table=qn(table), legacy=qn(legacy)))
+        # the legacy check was copied by LIKE, on the parent it would bound every partition
+        cursor.execute('ALTER TABLE {table} DROP CONSTRAINT {constraint}'.format(
+            table=qn(table), constraint=qn(get_legacy_check(table)),
+        ))
+        # The partition key has to be part of the primary key
+        cursor.execute('ALTER TABLE {table} ADD PRIMARY KEY (id, created)'.format(table=qn(table)))
+        cursor.execute('ALTER SEQUENCE {sequence} OWNED BY {table}.id'.format(sequence=sequence, table=qn(table)))
+        cursor.execute('''
+            ALTER TABLE {table} ADD CONSTRAINT {constraint}
+            FOREIGN KEY (visitor_id) REFERENCES {visitor_table} (id) DEFERRABLE INITIALLY DEFERRED
+        '''.format(
+            table=qn(table),
+            constraint=qn('%s_visitor_id_fk' % table),
+            visitor_table=qn(visitor_table),
+        ))
+        cursor.execute('CREATE INDEX {index} ON {table} (visitor_id)'.format(
+            index=qn('%s_visitor_id_idx' % table), table=qn(table),
+        ))
+
+        # implied by the validated legacy check, so ATTACH doesn't scan
+        cursor.execute('ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO (%s)'.format(
+            table=qn(table), legacy=qn(legacy),
+        ), [bound])
+        cursor.execute('CREATE TABLE {default} PARTITION OF {table} DEFAULT'.format(
+            default=qn('%s_default' % table), table=qn(table),
+        ))
+
+    ensure_partitions(connection, months_ahead, now=now, table=table)
@@ -0,0 +1,138 @@
+"""
+Daily and hourly rollups of WebEvent.
+
+Ids are drawn before their rows commit, so events are folded by the
+transaction that inserted them instead: a run folds the events of the
+transactions which ended since the last one, those below the xmin of its
+snapshot (`txid_snapshot_xmin`), and moves the mark in the same transaction
+as the counts, so a failed or repeated run never counts an event twice and
+no lock is taken on WebEvent. The rows are scanned past an id floor, which
+follows the highest id of a run once the transactions that were running
+then are over.
+Daily periods are days in settings.TIME_ZONE, hourly ones are UTC hours.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+# third party
+from analytics.models import (
+    RollupHighWaterMark, WebEvent, WebEventDailyRollup, WebEventHourlyRollup,
+)
+
+
+HIGH_WATER_MARK = 'webevents'
+
+# the txid of the transaction inserting a row, given txid_current() as %s
+ROW_XID = '%s - age(xmin)'
+
+FOLD_SQL = '''
+    INSERT INTO {rollup} (period, url_name, device_type, ip_country, status_code, events, hits)
+    SELECT {period}, url_name, device_type, ip_country, status_code, COUNT(*), SUM(sample_weight)
+    FROM {webevent}
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (period, url_name, device_type, ip_country, status_code) DO UPDATE SET
+        events = {rollup}.events + EXCLUDED.events,
+        hits = {rollup}.hits + EXCLUDED.hits
+'''
+
+PERIODS = (
+    (WebEventDailyRollup, '(created AT TIME ZONE %s)::date', lambda: [settings.TIME_ZONE]),
+    (WebEventHourlyRollup, "date_trunc('hour', created AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'", lambda: []),
+)
+
+
+def _fold(connection, where, params):
+    """Returns the number of daily rollup rows written"""
+    qn = connection.ops.quote_name
+    written = 0
+    with connection.cursor() as cursor:
+        for model, period, period_params in PERIODS:
+            cursor.execute(FOLD_SQL.format(
+                rollup=qn(model._meta.db_table),
+                period=period,
+                webevent=qn(WebEvent._meta.db_table),
+                where=where,
+            ), period_params() + params)
+            if model is WebEventDailyRollup:
+                written = cursor.rowcount
+    return written
+
+
+def _get_txids(connection):
+    """txid_current() and the xmin of the current snapshot"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_current(), txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()
+
+
+def fold_events(batch_size, using=None):
+    """
+    Folds the events of the transactions which ended since the last run,
+    in one transaction, `batch_size` ids per statement. Returns the number
+    of daily rollup rows written.
+    """
+    using = using or router.db_for_write(WebEvent)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        mark, _ = RollupHighWaterMark.objects.using(using).select_for_update().get_or_create(
+            name=HIGH_WATER_MARK,
+        )
+        current, xmin = _get_txids(connection)
+        # the transactions below `xmin` are over, their rows are visible from here on
+        upper = WebEvent.objects.using(using).aggregate(upper=Max('id'))['upper'] or 0
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT txid_snapshot_xmax(txid_current_snapshot())')
+            xmax, = cursor.fetchone()
+
+        written = 0
+        where = 'id > %s AND id <= %s AND {xid} >= %s AND {xid} < %s'.format(xid=ROW_XID)
+        for start in range(mark.last_id, upper, batch_size):
+            written += _fold(connection, where, [
+                start, min(start + batch_size, upper), current, mark.last_xid, current, xmin,
+            ])
+
+        if mark.pending_xid is not None and xmin >= mark.pending_xid:
+            # the transactions that could hold ids up to pending_id are over
+            # and their events were folded, by now at the latest
+            mark.last_id = mark.pending_id
+            mark.pending_id = mark.pending_xid = None
+        if mark.pending_id is None and upper > mark.last_id:
+            mark.pending_id, mark.pending_xid = upper, xmax
+        mark.last_xid = xmin
+        mark.save()
+    return written
+
+
+def rebuild(start, end, using=None):
+    """Recounts the rollups of the days from `start` to `end` (dates, inclusive)"""
+    using = using or router.db_for_write(WebEvent)
+    tz = timezone.get_default_timezone()
+    lower = timezone.make_aware(datetime.datetime.combine(start, datetime.time()), tz)
+    upper = timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time()), tz)
+    with transaction.atomic(using=using):
+        mark, _ = RollupHighWaterMark.objects.using(using).select_for_update().get_or_create(name=HIGH_WATER_MARK)
+        current, xmin = _get_txids(connections[using])
+        WebEventDailyRollup.objects.using(using).filter(period__range=(start, end)).delete()
+        WebEventHourlyRollup.objects.using(using).filter(period__gte=lower, period__lt=upper).delete()
+        # the events folded so far, the others are left to the next fold
+        _fold(
+            connections[using],
+            'created >= %s AND created < %s AND (id <= %s OR {xid} < %s)'.format(xid=ROW_XID),
+            [lower, upper, mark.last_id, current, mark.last_xid],
+        )
+
+
+def report(rollup, start, end, *dimensions):
+    """Hits per period and `dimensions` between `start` and `end` (inclusive)"""
+    return rollup.objects.filter(
+        period__gte=start,
+        period__lte=end,
+    ).values('period', *dimensions).annotate(
+        total_events=Sum('events'),
+        total_hits=Sum('hits'),
+    ).order_by('period', *dimensions)
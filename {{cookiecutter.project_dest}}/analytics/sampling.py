@@ -0,0 +1,76 @@
+import random
+import threading
+import time
+from collections import defaultdict
+
+# third party
+from analytics.settings import (
+    TRACK_MAX_EVENTS_BURST, TRACK_MAX_EVENTS_PER_SECOND,
+    TRACK_SAMPLE_RATES_BY_DEVICE_TYPE, TRACK_SAMPLE_RATES_BY_URL_NAME,
+)
+
+
+class TokenBucket(object):
+    """Allows `rate` events per second on average and `burst` at once"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+
+class Sampler(object):
+    """
+    Decides which hits get tracked and how many hits each tracked one
+    stands for (its sample weight).
+    """
+
+    def __init__(self, url_name_rates=None, device_type_rates=None, max_per_second=None, burst=None):
+        self.url_name_rates = url_name_rates or {}
+        self.device_type_rates = device_type_rates or {}
+        self.bucket = TokenBucket(max_per_second, burst) if max_per_second else None
+        self.dropped = 0
+        # weight of the hits the rate limit dropped, handed over to the next
+        # tracked hit of the same kind so that totals can still be extrapolated
+        self._carried_weights = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def sample_rate(self, url_name, device_type):
+        return self.url_name_rates.get(url_name, 1.0) * self.device_type_rates.get(device_type, 1.0)
+
+    def sample(self, url_name, device_type):
+        """Returns the weight to track the hit with, None when it isn't tracked"""
+        rate = self.sample_rate(url_name, device_type)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return None
+        weight = 1 / rate
+        if self.bucket is None:
+            return weight
+
+        key = (url_name, device_type)
+        with self._lock:
+            if not self.bucket.consume():
+                self.dropped += 1
+                self._carried_weights[key] += weight
+                return None
+            return weight + self._carried_weights.pop(key, 0.0)
+
+
+sampler = Sampler(
+    url_name_rates=TRACK_SAMPLE_RATES_BY_URL_NAME,
+    device_type_rates=TRACK_SAMPLE_RATES_BY_DEVICE_TYPE,
+    max_per_second=TRACK_MAX_EVENTS_PER_SECOND,
+    burst=TRACK_MAX_EVENTS_BURST,
+)
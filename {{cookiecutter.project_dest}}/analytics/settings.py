@@ -1,3 +1,5 @@
+import os
+
 from django.conf import settings
 
 
@@ -11,9 +13,128 @@ TRACK_IGNORE_URLS = getattr(settings, 'TRACK_IGNORE_URLS', (
 ))
 
 TRACK_IGNORE_USER_AGENTS = getattr(settings, 'TRACK_IGNORE_USER_AGENTS', tuple())
+# Number of user agent verdicts kept per process
+TRACK_IGNORE_CACHE_SIZE = getattr(settings, 'TRACK_IGNORE_CACHE_SIZE', 10000)
 
 TRACK_IGNORE_STATUS_CODES = getattr(settings, 'TRACK_IGNORE_STATUS_CODES', [])
 
 TRACK_USING_GEOIP = getattr(settings, 'TRACK_USING_GEOIP', False)
 if hasattr(settings, 'TRACKING_USE_GEOIP'):
     raise DeprecationWarning('TRACKING_USE_GEOIP is now TRACK_USING_GEOIP')
+
+# Refresh the Visitor with a single INSERT ... ON CONFLICT statement instead of
+# reading it and saving it back
+TRACK_VISITOR_UPSERT = getattr(settings, 'TRACK_VISITOR_UPSERT', True)
+
+# 'sync' writes Visitor/WebEvent rows while the response is being processed,
+# 'async' hands a captured record to the background writer (analytics.writer),
+# 'spool' appends it to a local disk spool shipped by drain_spool (analytics.spool)
+TRACK_WRITE_MODE = getattr(settings, 'TRACK_WRITE_MODE', 'sync')
+
+TRACK_WRITER_QUEUE_SIZE = getattr(settings, 'TRACK_WRITER_QUEUE_SIZE', 10000)
+TRACK_WRITER_FLUSH_SIZE = getattr(settings, 'TRACK_WRITER_FLUSH_SIZE', 500)
+TRACK_WRITER_FLUSH_INTERVAL = getattr(settings, 'TRACK_WRITER_FLUSH_INTERVAL', 2.0)  # seconds
+
+# What to do with a record when the writer queue is full:
+# 'drop_newest', 'drop_oldest' or 'block' (for at most TRACK_WRITER_BLOCK_TIMEOUT seconds)
+TRACK_WRITER_OVERFLOW = getattr(settings, 'TRACK_WRITER_OVERFLOW', 'drop_newest')
+TRACK_WRITER_BLOCK_TIMEOUT = getattr(settings, 'TRACK_WRITER_BLOCK_TIMEOUT', 0.05)
+
+# AsyncVisitorTrackingMiddleware: hits written at the same time, and waiting
+# to be written before new ones are dropped
+TRACK_ASYNC_WRITER_CONCURRENCY = getattr(settings, 'TRACK_ASYNC_WRITER_CONCURRENCY', 4)
+TRACK_ASYNC_WRITER_MAX_PENDING = getattr(settings, 'TRACK_ASYNC_WRITER_MAX_PENDING', 1000)
+
+# Passed as `cache` to GeoIP2, 0 is MODE_AUTO and 2 is MODE_MMAP (memory-mapped)
+TRACK_GEOIP_CACHE_MODE = getattr(settings, 'TRACK_GEOIP_CACHE_MODE', 0)
+# Number of IP address lookups kept per process
+TRACK_GEOIP_LRU_SIZE = getattr(settings, 'TRACK_GEOIP_LRU_SIZE', 10000)
+
+# Number of parsed user agents kept per process
+TRACK_USER_AGENT_CACHE_SIZE = getattr(settings, 'TRACK_USER_AGENT_CACHE_SIZE', 10000)
+
+# Track bots (DEVICE_TYPES.BOT), they're dropped before any database or GeoIP work otherwise
+TRACK_BOTS = getattr(settings, 'TRACK_BOTS', True)
+
+# Fraction of the hits to track per url name and per device type (the rates
+# are multiplied), eg. {'domain:accept_cookie_disclaimer': 0.1} and {'BOT': 0.01}.
+# Hits left out are not recorded at all, the tracked ones get a WebEvent with
+# `sample_weight` set to the number of hits they stand for.
+TRACK_SAMPLE_RATES_BY_URL_NAME = getattr(settings, 'TRACK_SAMPLE_RATES_BY_URL_NAME', {})
+TRACK_SAMPLE_RATES_BY_DEVICE_TYPE = getattr(settings, 'TRACK_SAMPLE_RATES_BY_DEVICE_TYPE', {})
+
+# Maximum number of hits tracked per second by each process, None for no limit
+TRACK_MAX_EVENTS_PER_SECOND = getattr(settings, 'TRACK_MAX_EVENTS_PER_SECOND', None)
+# Hits that can be tracked at once after a quiet period, a second worth by default
+TRACK_MAX_EVENTS_BURST = getattr(settings, 'TRACK_MAX_EVENTS_BURST', None)
+
+# Session keys copied into Visitor.data, None copies the whole session
+TRACK_SESSION_KEYS = getattr(settings, 'TRACK_SESSION_KEYS', None)
+# Number of session snapshot digests kept per process to skip rewriting unchanged sessions
+TRACK_SESSION_SNAPSHOT_CACHE_SIZE = getattr(settings, 'TRACK_SESSION_SNAPSHOT_CACHE_SIZE', 10000)
+
+# WebEvent is partitioned by month on `created`, see analytics.partitions
+# Months of partitions created ahead of time by manage_webevent_partitions
+TRACK_WEBEVENT_PARTITIONS_AHEAD = getattr(settings, 'TRACK_WEBEVENT_PARTITIONS_AHEAD', 3)
+# Months of events kept by manage_webevent_partitions, None keeps everything
+TRACK_WEBEVENT_RETENTION_MONTHS = getattr(settings, 'TRACK_WEBEVENT_RETENTION_MONTHS', None)
+
+# Most event ids folded into the rollups per statement
+TRACK_ROLLUP_BATCH_SIZE = getattr(settings, 'TRACK_ROLLUP_BATCH_SIZE', 100000)
+
+TRACK_SPOOL_DIR = getattr(settings, 'TRACK_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'var', 'spool', 'analytics'))
+# A segment is sealed (and can be drained) once it reaches this size or age
+TRACK_SPOOL_SEGMENT_SIZE = getattr(settings, 'TRACK_SPOOL_SEGMENT_SIZE', 8 * 1024 * 1024)  # bytes
+TRACK_SPOOL_SEGMENT_AGE = getattr(settings, 'TRACK_SPOOL_SEGMENT_AGE', 10)  # seconds
+# Records are dropped while the spool holds more than this
+TRACK_SPOOL_MAX_SIZE = getattr(settings, 'TRACK_SPOOL_MAX_SIZE', 1024 * 1024 * 1024)  # bytes
+# Appends are fsync'ed together at most once per interval
+TRACK_SPOOL_FSYNC_INTERVAL = getattr(settings, 'TRACK_SPOOL_FSYNC_INTERVAL', 0.2)  # seconds
+
+# Response headers stored with a WebEvent (case insensitive), None keeps them all
+TRACK_RESPONSE_HEADERS = getattr(settings, 'TRACK_RESPONSE_HEADERS', (
+    'Content-Type',
+    'Content-Language',
+    'Cache-Control',
+    'Vary',
+))
+# Stored headers whose values change from one response to the next: they're
+# kept on the WebEvent instead of its (deduplicated) ResponseHeaderSet
+TRACK_RESPONSE_VALUE_HEADERS = getattr(settings, 'TRACK_RESPONSE_VALUE_HEADERS', (
+    'Content-Length',
+    'Location',
+    'Date',
+    'Expires',
+    'Last-Modified',
+    'ETag',
+    'Set-Cookie',
+))
+# GET/POST parameters stored with a WebEvent, None keeps them all
+TRACK_REQUEST_PARAMS = getattr(settings, 'TRACK_REQUEST_PARAMS', None)
+# GET/POST parameters never stored
+TRACK_IGNORE_REQUEST_PARAMS = getattr(settings, 'TRACK_IGNORE_REQUEST_PARAMS', (
+    'csrfmiddlewaretoken',
+    'password',
+    'password1',
+    'password2',
+))
+# Longest header or parameter value stored, longer ones are truncated
+TRACK_VALUE_MAX_LENGTH = getattr(settings, 'TRACK_VALUE_MAX_LENGTH', 256)
+# Number of response header set ids kept per process
+TRACK_HEADER_SET_CACHE_SIZE = getattr(settings, 'TRACK_HEADER_SET_CACHE_SIZE', 1000)
+
+# Number of session_key -> Visitor ids kept per process so that a hit of a
+# known session is a narrow UPDATE, 0 disables it
+TRACK_VISITOR_CACHE_SIZE = getattr(settings, 'TRACK_VISITOR_CACHE_SIZE', 10000)
+# Django cache alias to share the map between processes instead, eg. 'default'
+TRACK_VISITOR_CACHE_ALIAS = getattr(settings, 'TRACK_VISITOR_CACHE_ALIAS', None)
+TRACK_VISITOR_CACHE_TTL = getattr(settings, 'TRACK_VISITOR_CACHE_TTL', settings.SESSION_COOKIE_AGE)  # seconds
+
+# Time the phases of VisitorTrackingMiddleware, see analytics.metrics
+TRACK_METRICS = getattr(settings, 'TRACK_METRICS', True)
+# Durations kept per phase to compute percentiles
+TRACK_METRICS_RESERVOIR_SIZE = getattr(settings, 'TRACK_METRICS_RESERVOIR_SIZE', 2048)
+# Also send the timings to a statsd server when the host is set
+TRACK_STATSD_HOST = getattr(settings, 'TRACK_STATSD_HOST', None)
+TRACK_STATSD_PORT = getattr(settings, 'TRACK_STATSD_PORT', 8125)
+TRACK_STATSD_PREFIX = getattr(settings, 'TRACK_STATSD_PREFIX', 'analytics')
@@ -0,0 +1,63 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# third party
+from analytics.settings import (
+    TRACK_SESSION_KEYS, TRACK_SESSION_SNAPSHOT_CACHE_SIZE,
+)
+from analytics.utils import remap_keys
+from common.forms import DjangoQuerysetJSONEncoder
+
+
+class SessionSnapshots(object):
+    """
+    Remembers a digest of the session data last written to Visitor.data for
+    the most recent `size` session keys, so that unchanged sessions are
+    neither encoded nor written again.
+
+    A digest is only remembered once its data is written (`remember`): a
+    dropped or failed write leaves the next hit to write the data again.
+    """
+
+    def __init__(self, size=TRACK_SESSION_SNAPSHOT_CACHE_SIZE, keys=TRACK_SESSION_KEYS):
+        self.size = size
+        self.keys = keys
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_digest(self, encoded):
+        return hashlib.sha1(encoded.encode()).digest()
+
+    def capture(self, session):
+        """
+        Returns the JSON encoded data of `session`, or None when the copy
+        written for a previous hit of this session is still current.
+        """
+        session_key = session.session_key
+        if not session.modified and session_key in self._digests:
+            return None
+
+        data = dict(session.items())
+        if self.keys is not None:
+            data = {key: value for key, value in data.items() if key in self.keys}
+        encoded = json.dumps(remap_keys(data), cls=DjangoQuerysetJSONEncoder)
+
+        with self._lock:
+            unchanged = self._digests.get(session_key) == self.get_digest(encoded)
+        return None if unchanged else encoded
+
+    def remember(self, session_key, encoded):
+        """Records that `encoded`, as returned by `capture`, is now in Visitor.data"""
+        if encoded is None:
+            return
+        digest = self.get_digest(encoded)
+        with self._lock:
+            self._digests[session_key] = digest
+            self._digests.move_to_end(session_key)
+            while len(self._digests) > self.size:
+                self._digests.popitem(last=False)
+
+
+session_snapshots = SessionSnapshots()
@@ -0,0 +1,244 @@
+"""
+Append-only local disk spool of EventRecords.
+
+Every process appends to its own segment file, one frame per record:
+a 4 bytes big endian payload length, the 4 bytes CRC32 of the payload and
+the payload itself (`writer.dump_record`). A segment is written as
+`<created ms>-<pid>-<sequence>.open` and renamed to `.seg` once it's
+sealed, only sealed segments are shipped by `drain_spool`, which deletes
+them once their records are committed.
+
+Frames are written with a single `os.write`, so a crashed process loses
+nothing already appended; fsyncs are batched, so a crashed machine may
+lose up to TRACK_SPOOL_FSYNC_INTERVAL seconds of records. A torn frame at
+the end of a segment is detected by its length or CRC and skipped.
+"""
+import atexit
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+# third party
+from analytics.settings import (
+    TRACK_SPOOL_DIR, TRACK_SPOOL_FSYNC_INTERVAL, TRACK_SPOOL_MAX_SIZE,
+    TRACK_SPOOL_SEGMENT_AGE, TRACK_SPOOL_SEGMENT_SIZE,
+)
+from analytics.writer import dump_record, load_record
+
+
+logger = logging.getLogger('analytics')
+
+FRAME_HEADER = struct.Struct('>II')
+OPEN_SUFFIX = '.open'
+SEALED_SUFFIX = '.seg'
+CORRUPT_SUFFIX = '.bad'
+
+
+def parse_segment_name(name):
+    """Returns (created ms, pid) of a segment file name"""
+    created, pid, _ = name.split('.', 1)[0].split('-')
+    return int(created), int(pid)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SpoolWriter(object):
+    """Appends records to the segment of the current process"""
+
+    def __init__(self, directory=TRACK_SPOOL_DIR, segment_size=TRACK_SPOOL_SEGMENT_SIZE,
+                 segment_age=TRACK_SPOOL_SEGMENT_AGE, max_size=TRACK_SPOOL_MAX_SIZE,
+                 fsync_interval=TRACK_SPOOL_FSYNC_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segment_age = segment_age
+        self.max_size = max_size
+        self.fsync_interval = fsync_interval
+        self.appended = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._sequence = 0
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        self._opened = time.time()
+        self._name = '%d-%d-%d%s' % (self._opened * 1000, os.getpid(), self._sequence, OPEN_SUFFIX)
+        self._fd = os.open(os.path.join(self.directory, self._name), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._written = 0
+        self._synced = time.monotonic()
+        self._dirty = False
+        # the cap is checked against a size refreshed once per segment
+        self._spool_size = spool_size(self.directory)
+
+    def _seal_segment(self):
+        if self._dirty:
+            os.fsync(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        path = os.path.join(self.directory, self._name)
+        try:
+            os.rename(path, path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        except FileNotFoundError:
+            # sealed by drain_spool as stale already
+            pass
+
+    def append(self, record):
+        payload = dump_record(record).encode('utf-8')
+        frame = FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._pid != os.getpid():
+                # The segment inherited through fork() belongs to the parent
+                if self._pid is None:
+                    atexit.register(self.close)
+                self._pid = os.getpid()
+                self._fd = None
+            if self._fd is not None and (
+                self._written >= self.segment_size or time.time() - self._opened >= self.segment_age
+            ):
+                self._seal_segment()
+            if self._fd is None:
+                self._open_segment()
+
+            if self._spool_size + self._written + len(frame) > self.max_size:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning('Analytics spool is full, %d events dropped so far', self.dropped)
+                return False
+
+            os.write(self._fd, frame)
+            self._written += len(frame)
+            self._dirty = True
+            self.appended += 1
+            if time.monotonic() - self._synced >= self.fsync_interval:
+                os.fsync(self._fd)
+                self._synced = time.monotonic()
+                self._dirty = False
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                self._seal_segment()
+
+
+def spool_size(directory):
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+    except FileNotFoundError:
+        return 0
+
+
+def recover_segments(directory, stale_after=TRACK_SPOOL_SEGMENT_AGE * 3):
+    """
+    Seals the open segments left behind by dead processes, or untouched for
+    `stale_after` seconds (a writer never appends to a segment older than
+    TRACK_SPOOL_SEGMENT_AGE)
+    """
+    recovered = []
+    now = time.time()
+    if not os.path.isdir(directory):
+        return recovered
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(OPEN_SUFFIX):
+            continue
+        created, pid = parse_segment_name(entry.name)
+        if pid_alive(pid) and now - entry.stat().st_mtime < stale_after:
+            continue
+        try:
+            os.rename(entry.path, entry.path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        except FileNotFoundError:
+            continue
+        recovered.append(entry.name)
+    return recovered
+
+
+def sealed_segments(directory):
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(SEALED_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names, key=parse_segment_name)]
+
+
+def read_segment(path):
+    """Returns (records, number of trailing bytes that couldn't be read)"""
+    with open(path, 'rb') as segment:
+        content = segment.read()
+    records = []
+    offset = 0
+    while offset + FRAME_HEADER.size <= len(content):
+        length, crc = FRAME_HEADER.unpack_from(content, offset)
+        payload = content[offset + FRAME_HEADER.size:offset + FRAME_HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(load_record(payload.decode('utf-8')))
+        offset += FRAME_HEADER.size + length
+    return records, len(content) - offset
+
+
+def drain(directory, load_records):
+    """
+    Ships the sealed segments with `load_records`, oldest first, and deletes
+    each one once its records are written. Returns the number of records.
+
+    A segment is loaded with a single `load_records` call (one transaction),
+    so a failed load is retried whole without duplicating events.
+    """
+    recover_segments(directory)
+    drained = 0
+    for path in sealed_segments(directory):
+        records, unreadable = read_segment(path)
+        if records:
+            load_records(records)
+        drained += len(records)
+        if unreadable:
+            logger.error('Analytics spool segment %s ends with %d unreadable bytes', path, unreadable)
+            os.rename(path, path[:-len(SEALED_SUFFIX)] + CORRUPT_SUFFIX)
+        else:
+            os.unlink(path)
+    return drained
+
+
+def spool_stats(directory):
+    """Depth and lag of the spool, lag being the age of its oldest record"""
+    stats = {'open_segments': 0, 'sealed_segments': 0, 'corrupt_segments': 0, 'bytes': 0, 'lag': 0.0}
+    oldest = None
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return stats
+    for entry in entries:
+        for suffix, key in ((OPEN_SUFFIX, 'open_segments'), (SEALED_SUFFIX, 'sealed_segments'),
+                            (CORRUPT_SUFFIX, 'corrupt_segments')):
+            if entry.name.endswith(suffix):
+                break
+        else:
+            continue
+        stats[key] += 1
+        try:
+            size = entry.stat().st_size
+        except FileNotFoundError:
+            continue
+        stats['bytes'] += size
+        if size and key != 'corrupt_segments':
+            created, _ = parse_segment_name(entry.name)
+            oldest = created if oldest is None else min(oldest, created)
+    if oldest is not None:
+        stats['lag'] = max(0.0, time.time() - oldest / 1000)
+    return stats
+
+
+spool_writer = SpoolWriter()
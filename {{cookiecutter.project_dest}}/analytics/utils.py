@@ -1,3 +1,39 @@
+import json
+
+
+def remap_keys(mapping):
+    return [{'key': k, 'value': mapping[k]} for k in mapping]
+
+
 def total_seconds(delta):
     day_seconds = (delta.days * 24 * 3600) + delta.seconds
     return (delta.microseconds + day_seconds * 10**6) / 10**6
+
+
+def update_visitor(visitor, values, visit_time):
+    """Copies the values captured for a hit at `visit_time` onto `visitor`"""
+    # Update the user field if the visitor user is not set. This
+    # implies authentication has occured on this request and now
+    # the user is object exists. Check using `user_id` to prevent
+    # a database hit.
+    user_id = values.get('user_id')
+    if user_id and visitor.user_id != user_id:
+        visitor.user_id = user_id
+
+    # update some session expiration details
+    visitor.expiry_age = values['expiry_age']
+    visitor.expiry_time = values['expiry_time']
+
+    # grab the latest User-Agent and store it
+    if values.get('user_agent'):
+        visitor.user_agent = values['user_agent']
+
+    time_on_site = 0
+    if visitor.created:
+        time_on_site = total_seconds(visit_time - visitor.created)
+    visitor.time_on_site = int(time_on_site)
+    # data is already JSON encoded, None when it didn't change
+    if values['data'] is not None:
+        visitor.data = json.loads(values['data'])
+    visitor.modified = visit_time
+    return visitor
@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+# third party
+from analytics.models import VisitorKey
+from analytics.settings import (
+    TRACK_VISITOR_CACHE_ALIAS,
+    TRACK_VISITOR_CACHE_SIZE, TRACK_VISITOR_CACHE_TTL,
+)
+
+
+class VisitorCache(object):
+    """
+    Maps a session_key to the VisitorKey of its Visitor for `ttl` seconds,
+    in a bounded per-process LRU or in the Django cache `alias` when set.
+    """
+    KEY_PREFIX = 'analytics:visitor:'
+
+    def __init__(self, size=TRACK_VISITOR_CACHE_SIZE, ttl=TRACK_VISITOR_CACHE_TTL, alias=TRACK_VISITOR_CACHE_ALIAS):
+        self.size = size
+        self.ttl = ttl
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.size or self.alias)
+
+    def get(self, session_key):
+        if self.alias:
+            value = caches[self.alias].get(self.KEY_PREFIX + session_key)
+            return VisitorKey(*value) if value else None
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[session_key]
+                return None
+            self._entries.move_to_end(session_key)
+            return entry[1]
+
+    def set(self, session_key, key):
+        if self.alias:
+            caches[self.alias].set(self.KEY_PREFIX + session_key, tuple(key), self.ttl)
+            return
+        with self._lock:
+            self._entries[session_key] = (time.monotonic() + self.ttl, key)
+            self._entries.move_to_end(session_key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_key):
+        if self.alias:
+            caches[self.alias].delete(self.KEY_PREFIX + session_key)
+            return
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+
+visitor_cache = VisitorCache()
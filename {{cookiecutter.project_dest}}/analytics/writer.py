@@ -0,0 +1,277 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.db import close_old_connections, router, transaction
+from django.utils.dateparse import parse_datetime
+
+# third party
+from analytics.headers import header_sets
+from analytics.models import Visitor, WebEvent
+from analytics.settings import (
+    TRACK_ASYNC_WRITER_CONCURRENCY, TRACK_ASYNC_WRITER_MAX_PENDING,
+    TRACK_WRITER_BLOCK_TIMEOUT, TRACK_WRITER_FLUSH_INTERVAL,
+    TRACK_WRITER_FLUSH_SIZE, TRACK_WRITER_OVERFLOW, TRACK_WRITER_QUEUE_SIZE,
+)
+from analytics.snapshots import session_snapshots
+from common.forms import DjangoQuerysetJSONEncoder
+
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:  # Django < 3.0, no async support anyway
+    sync_to_async = None
+
+
+logger = logging.getLogger('analytics')
+
+
+EventRecord = namedtuple('EventRecord', (
+    'session_key',
+    'visit_time',
+    'visitor',  # dict of Visitor values captured for the hit
+    'event',  # dict of WebEvent values, None when pageviews aren't tracked
+))
+
+
+class UnSupportedOverflowPolicy(Exception):
+    pass
+
+
+def dump_record(record):
+    """Encodes an EventRecord as one line of JSON"""
+    return json.dumps(record._asdict(), cls=DjangoQuerysetJSONEncoder, separators=(',', ':'))
+
+
+def load_record(line):
+    """Decodes a line written by `dump_record` back into an EventRecord"""
+    record = EventRecord(**json.loads(line))
+    visitor = record.visitor
+    if visitor.get('expiry_time'):
+        visitor['expiry_time'] = parse_datetime(visitor['expiry_time'])
+    return record._replace(visit_time=parse_datetime(record.visit_time))
+
+
+def coalesce_visitors(records):
+    """
+    Folds the records of a batch into one entry per session_key:
+    {session_key: (first visit_time, last visit_time, merged visitor values)}
+    """
+    visitors = OrderedDict()
+    for record in records:
+        if record.session_key not in visitors:
+            values = dict(record.visitor)
+            visitors[record.session_key] = [record.visit_time, record.visit_time, values]
+            continue
+        entry = visitors[record.session_key]
+        values = entry[2]
+        entry[1] = max(entry[1], record.visit_time)
+        for key, value in record.visitor.items():
+            # landing_url is kept from the first hit, user, user agent and
+            # session data are only ever replaced by a known value
+            if key == 'landing_url' or (key in ('user_id', 'user_agent', 'data') and not value):
+                continue
+            values[key] = value
+    return OrderedDict((key, tuple(entry)) for key, entry in visitors.items())
+
+
+def write_records(records):
+    """Writes a batch of EventRecords with one upsert and one bulk insert"""
+    tracked = [record for record in records if record.event is not None]
+    # Header sets are committed on their own, so that the ids cached by
+    # `header_sets` never point at a rolled back row
+    events = header_sets.intern([record.event for record in tracked])
+    using = router.db_for_write(WebEvent)
+    with transaction.atomic(using=using):
+        visitor_ids = Visitor.objects.bulk_upsert(coalesce_visitors(records))
+        WebEvent.objects.bulk_create([
+            WebEvent(visitor_id=visitor_ids[record.session_key], created=record.visit_time, **event)
+            for record, event in zip(tracked, events)
+        ])
+
+
+class EventWriter(object):
+    """
+    In-process bounded queue of EventRecords drained by a background thread.
+
+    The thread is started lazily on the first submit (so that it's started
+    in the worker processes of a pre-forking server) and flushes at most
+    `flush_size` records every `flush_interval` seconds.
+    """
+    OVERFLOW_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+    def __init__(self, queue_size=TRACK_WRITER_QUEUE_SIZE, flush_size=TRACK_WRITER_FLUSH_SIZE,
+                 flush_interval=TRACK_WRITER_FLUSH_INTERVAL, overflow=TRACK_WRITER_OVERFLOW,
+                 block_timeout=TRACK_WRITER_BLOCK_TIMEOUT):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise UnSupportedOverflowPolicy('Overflow policy not supported', overflow)
+        self.queue_size = queue_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # A queue inherited through fork() belongs to the parent
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._stopping = threading.Event()
+                if self._pid is None:
+                    atexit.register(self.stop)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, record):
+        self._ensure_started()
+        try:
+            if self.overflow == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            queued = False
+
+        if self.overflow == 'drop_oldest':
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(record)
+                queued = True
+            except queue.Full:
+                pass
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning('Analytics writer queue is full, %d events dropped so far', self.dropped)
+        return queued
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size and not self._stopping.is_set():
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def flush(self, batch):
+        close_old_connections()
+        try:
+            write_records(batch)
+        except Exception:
+            logger.exception('Unable to write %d analytics events', len(batch))
+        else:
+            self.written += len(batch)
+            for record in batch:
+                session_snapshots.remember(record.session_key, record.visitor.get('data'))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._collect()
+            if batch:
+                self.flush(batch)
+
+        remaining = self._drain()
+        for start in range(0, len(remaining), self.flush_size):
+            self.flush(remaining[start:start + self.flush_size])
+        close_old_connections()
+
+    def stop(self, timeout=10):
+        """Flushes whatever is queued and stops the thread, called at worker shutdown"""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def qsize(self):
+        return self._queue.qsize() if self._pid == os.getpid() else 0
+
+
+class AsyncWriter(object):
+    """
+    Runs blocking writes as fire-and-forget tasks of the running event loop,
+    at most `concurrency` of them at a time in worker threads. Writes are
+    dropped once `max_pending` of them are waiting.
+    """
+
+    def __init__(self, concurrency=TRACK_ASYNC_WRITER_CONCURRENCY, max_pending=TRACK_ASYNC_WRITER_MAX_PENDING):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.written = 0
+        self._semaphores = {}
+        # keeps the scheduled tasks from being garbage collected
+        self._tasks = set()
+
+    def _get_semaphore(self, loop):
+        # An asyncio.Semaphore belongs to the loop it's first used in
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[loop]
+
+    def _write(self, func, args):
+        close_old_connections()
+        try:
+            func(*args)
+        finally:
+            close_old_connections()
+
+    async def _run(self, func, args):
+        async with self._get_semaphore(asyncio.get_running_loop()):
+            try:
+                await sync_to_async(self._write, thread_sensitive=False)(func, args)
+            except Exception:
+                logger.exception('Unable to write an analytics event')
+            else:
+                self.written += 1
+
+    def schedule(self, func, *args):
+        """Schedules `func(*args)`, returns False when it's dropped"""
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning('Analytics async writer is saturated, %d events dropped so far', self.dropped)
+            return False
+        task = asyncio.get_running_loop().create_task(self._run(func, args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def pending(self):
+        return len(self._tasks)
+
+
+event_writer = EventWriter()
+async_writer = AsyncWriter()
@@ -0,0 +1,45 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import router
+
+
+class Command(BaseCommand):
+    help = 'Times the database routers per call of db_for_read, db_for_write and allow_migrate, cold and warm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='passes over every model')
+
+    def handle(self, *args, **options):
+        models = apps.get_models()
+        iterations = options['iterations']
+        calls = (
+            ('db_for_read', lambda model: router.db_for_read(model)),
+            ('db_for_write', lambda model: router.db_for_write(model)),
+            ('allow_migrate', lambda model: router.allow_migrate_model('default', model)),
+        )
+        for name, call in calls:
+            # cold: the caches are cleared before every call
+            start = time.perf_counter()
+            for _ in range(max(1, iterations // 10)):
+                for model in models:
+                    self.clear_caches()
+                    call(model)
+            cold = (time.perf_counter() - start) / (max(1, iterations // 10) * len(models))
+
+            self.clear_caches()
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for model in models:
+                    call(model)
+            warm = (time.perf_counter() - start) / (iterations * len(models))
+
+            self.stdout.write('{name:<14} cold {cold:8.2f}us  warm {warm:8.2f}us per call  ({models} models)'.format(
+                name=name, cold=cold * 10**6, warm=warm * 10**6, models=len(models),
+            ))
+
+    def clear_caches(self):
+        for instance in router.routers:
+            if hasattr(instance, 'clear_cache'):
+                instance.clear_cache()
@@ -0,0 +1,150 @@
+import hashlib
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+
+MIGRATE_FINGERPRINT_FILE = getattr(
+    settings, 'MIGRATE_FINGERPRINT_FILE', os.path.join(settings.BASE_DIR, 'var', 'migrate_all.fingerprint'),
+)
+
+
+def get_server(alias):
+    """Aliases on the same server and database can't be migrated independently"""
+    settings_dict = settings.DATABASES[alias]
+    return (settings_dict.get('HOST'), settings_dict.get('PORT'), settings_dict.get('NAME'))
+
+
+def get_fingerprint(aliases):
+    """
+    Hash of the migration files, of the databases they're applied to and of
+    what their django_migrations tables record, so that a recreated or
+    restored database doesn't match
+    """
+    digest = hashlib.sha1()
+    for alias in aliases:
+        digest.update(repr((alias, settings.DATABASES[alias].get('ENGINE'), get_server(alias))).encode('utf-8'))
+        applied = MigrationRecorder(connections[alias]).applied_migrations()
+        digest.update(repr(sorted(applied)).encode('utf-8'))
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    for key, migration in sorted(loader.disk_migrations.items()):
+        digest.update(repr(key).encode('utf-8'))
+        with open(sys.modules[migration.__module__].__file__, 'rb') as migration_file:
+            digest.update(migration_file.read())
+    return digest.hexdigest()
+
+
+def get_plans(aliases):
+    """alias -> [(migration, backwards)] still to apply"""
+    plans = {}
+    for alias in aliases:
+        executor = MigrationExecutor(connections[alias])
+        plans[alias] = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return plans
+
+
+def get_groups(plans):
+    """Lists of the aliases to migrate sharing a server and database, each one migrated in order"""
+    groups = {}
+    for alias, plan in sorted(plans.items()):
+        if plan:
+            groups.setdefault(get_server(alias), []).append(alias)
+    return list(groups.values())
+
+
+def migrate_aliases(aliases, verbosity, interactive):
+    """Migrates `aliases` one after the other, returns their output"""
+    output = []
+    for alias in aliases:
+        stdout = io.StringIO()
+        call_command('migrate', database=alias, interactive=interactive, verbosity=verbosity, stdout=stdout)
+        output.append((alias, stdout.getvalue()))
+        connections[alias].close()
+    return output
+
+
+class Command(BaseCommand):
+    help = (
+        'Migrates every database, those on different servers or databases in parallel, and skips '
+        'everything when the migrations, DATABASES and the applied migrations match the fingerprint of the last run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases', help='only these aliases')
+        parser.add_argument('--workers', type=int, default=len(settings.DATABASES))
+        parser.add_argument('--plan', action='store_true', help='show the migrations to apply and exit')
+        parser.add_argument('--force', action='store_true', help='ignore the fingerprint of the last run')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+
+    def handle(self, *args, **options):
+        aliases = self.get_aliases(options['databases'])
+        if not options['force'] and not options['plan'] and self.read_fingerprint() == get_fingerprint(aliases):
+            self.stdout.write('No migrations to apply, the fingerprint is unchanged.')
+            return
+
+        plans = get_plans(aliases)
+        self.show_plans(plans, options['plan'] or options['verbosity'] > 1)
+        if options['plan']:
+            return
+
+        self.migrate(get_groups(plans), options['workers'], options['verbosity'], options['interactive'])
+        if not options['databases']:
+            # what django_migrations records has changed
+            self.write_fingerprint(get_fingerprint(aliases))
+
+    def get_aliases(self, databases):
+        replicas = {
+            alias
+            for replica_set in getattr(settings, 'DB_REPLICA_ROUTER', {}).values()
+            for alias in replica_set
+        }
+        aliases = sorted(alias for alias in settings.DATABASES if alias not in replicas)
+        if databases:
+            unknown = set(databases) - set(aliases)
+            if unknown:
+                raise CommandError('Unknown or replica databases: %s' % ', '.join(sorted(unknown)))
+            aliases = sorted(databases)
+        return aliases
+
+    def show_plans(self, plans, verbose):
+        for alias, plan in plans.items():
+            self.stdout.write('%s: %d migration(s) to apply' % (alias, len(plan)))
+            if verbose:
+                for migration, backwards in plan:
+                    self.stdout.write('  %s%s' % ('(unapply) ' if backwards else '', migration))
+
+    def migrate(self, groups, workers, verbosity, interactive):
+        if len(groups) > 1 and workers > 1:
+            # forked workers must open their own connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+                futures = [executor.submit(migrate_aliases, group, verbosity, interactive) for group in groups]
+                results = [future.result() for future in futures]
+        else:
+            results = [migrate_aliases(group, verbosity, interactive) for group in groups]
+        for output in results:
+            for alias, text in output:
+                self.stdout.write('[%s]\n%s' % (alias, text))
+
+    def read_fingerprint(self):
+        try:
+            with open(MIGRATE_FINGERPRINT_FILE) as fingerprint_file:
+                return fingerprint_file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def write_fingerprint(self, fingerprint):
+        os.makedirs(os.path.dirname(MIGRATE_FINGERPRINT_FILE), exist_ok=True)
+        path = '%s.%d' % (MIGRATE_FINGERPRINT_FILE, os.getpid())
+        with open(path, 'w') as fingerprint_file:
+            fingerprint_file.write(fingerprint)
+        os.replace(path, MIGRATE_FINGERPRINT_FILE)
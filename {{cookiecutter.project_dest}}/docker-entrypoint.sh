@@ -1,6 +1,6 @@
 #!/bin/sh
 
-./manage.py migrate --noinput
+./manage.py migrate_all --noinput
 ./manage.py collectstatic --noinput
 
 exec "$@"
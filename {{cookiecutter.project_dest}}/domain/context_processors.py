@@ -6,6 +6,9 @@ from django.utils import formats
 from django.utils.translation import activate, get_language
 {% endif %}
 
+# third party
+from analytics.devices import get_user_agent
+
 
 def django_settings(request):
     return {
@@ -60,7 +63,7 @@ def misc(request):
         'COOKIE_DISCLAIMER_ACCEPTED': request.session.get('COOKIE_DISCLAIMER_ACCEPTED', False),
         'LOCAL_DATE_FORMAT': formats.get_format('DATE_FORMAT'),
         'CATEGORY': category,
-        'BASE_TEMPLATE': f'{category}/mobile.pug' if request.user_agent.is_mobile else f'{category}/desktop.pug',
+        'BASE_TEMPLATE': f'{category}/mobile.pug' if get_user_agent(request).is_mobile else f'{category}/desktop.pug',
         'SESSION_ID': (
             request.session.session_key
             if apps.is_installed('django.contrib.sessions')
@@ -1 +1,2 @@
+from .prefetch import prefetch_across_databases  # noqa
 from .router import Router  # noqa
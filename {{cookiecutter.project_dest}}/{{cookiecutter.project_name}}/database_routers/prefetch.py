@@ -0,0 +1,138 @@
+"""
+prefetch_related() for relations spanning databases.
+
+prefetch_related() queries the database the instances were read from, so
+it can't follow a relation into a model DB_APP_ROUTER / DB_MODEL_ROUTER
+put on another alias, e.g. analytics.Visitor -> auth.User. Here the
+related ids are batched per routed database and each batch is one
+`IN` query, the batches running concurrently on a thread pool.
+
+The queries run on other threads, hence other connections: they don't see
+the uncommitted writes of the calling thread's transaction.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, router
+
+
+DB_PREFETCH_BATCH_SIZE = getattr(settings, 'DB_PREFETCH_BATCH_SIZE', 1000)
+DB_PREFETCH_MAX_WORKERS = getattr(settings, 'DB_PREFETCH_MAX_WORKERS', 4)
+
+
+class Relation(object):
+    """A forward or reverse foreign key / one to one relation of `model` named `name`"""
+
+    def __init__(self, model, name):
+        field = None
+        for rel in model._meta.related_objects:
+            if rel.get_accessor_name() == name:
+                field = rel
+                break
+        if field is None:
+            field = model._meta.get_field(name)
+        if not field.is_relation or field.many_to_many or not (field.concrete or field.auto_created):
+            raise ValueError('Only foreign keys and one to one relations can be prefetched across databases',
+                             model._meta.label, name)
+        self.name = name
+        self.field = field
+        self.related_model = field.related_model
+        self.reverse = not field.concrete
+        if self.reverse:
+            # instance.<source_attr> == related.<target_attr>
+            self.source_attr = field.field.target_field.attname
+            self.target_attr = field.field.attname
+        else:
+            self.source_attr = field.attname
+            self.target_attr = field.target_field.attname
+
+    def get_queries(self, instances, batch_size):
+        """Yields (alias, values) batches of the related rows to fetch"""
+        values = sorted({getattr(instance, self.source_attr) for instance in instances} - {None})
+        for start in range(0, len(values), batch_size):
+            # routed per batch, so that reads spread over the replicas
+            yield router.db_for_read(self.related_model), values[start:start + batch_size]
+
+    def fetch(self, alias, values):
+        manager = self.related_model._base_manager if not self.reverse else self.related_model._default_manager
+        return list(manager.using(alias).filter(**{'%s__in' % self.target_attr: values}))
+
+    def stitch(self, instances, related):
+        """Fills the relation caches of `instances` from the `related` rows"""
+        if not self.reverse:
+            index = {getattr(obj, self.target_attr): obj for obj in related}
+            for instance in instances:
+                obj = index.get(getattr(instance, self.source_attr))
+                self.field.set_cached_value(instance, obj)
+                if obj is not None and self.field.one_to_one:
+                    self.field.remote_field.set_cached_value(obj, instance)
+            return
+        groups = defaultdict(list)
+        for obj in related:
+            groups[getattr(obj, self.target_attr)].append(obj)
+        for instance in instances:
+            objs = groups.get(getattr(instance, self.source_attr), [])
+            for obj in objs:
+                self.field.field.set_cached_value(obj, instance)
+            if self.field.one_to_one:
+                self.field.set_cached_value(instance, objs[0] if objs else None)
+                continue
+            # what prefetch_related() leaves behind for `instance.<name>.all()`
+            queryset = getattr(instance, self.name).get_queryset()
+            queryset._result_cache = objs
+            queryset._prefetch_done = True
+            instance.__dict__.setdefault('_prefetched_objects_cache', {})
+            instance._prefetched_objects_cache[self.field.get_cache_name()] = queryset
+
+
+def _fetch_in_thread(relation, alias, values):
+    try:
+        return relation.fetch(alias, values)
+    finally:
+        # the connection belongs to the pool thread
+        connections[alias].close()
+
+
+def prefetch_across_databases(instances, *lookups, batch_size=DB_PREFETCH_BATCH_SIZE,
+                              max_workers=DB_PREFETCH_MAX_WORKERS):
+    """
+    Like prefetch_related_objects(instances, *lookups) for relations to
+    other databases. Lookups may be nested: 'visitor__user'.
+    Returns the instances as a list.
+    """
+    instances = list(instances)
+    if not instances:
+        return instances
+    # first relation -> nested lookups
+    tree = {}
+    for lookup in lookups:
+        name, _, rest = lookup.partition('__')
+        nested = tree.setdefault(name, [])
+        if rest:
+            nested.append(rest)
+
+    relations = [Relation(type(instances[0]), name) for name in tree]
+    tasks = [
+        (relation, alias, values)
+        for relation in relations
+        for alias, values in relation.get_queries(instances, batch_size)
+    ]
+    results = defaultdict(list)
+    if len(tasks) == 1:
+        relation, alias, values = tasks[0]
+        results[relation.name] = relation.fetch(alias, values)
+    elif tasks:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+            futures = [(task[0], executor.submit(_fetch_in_thread, *task)) for task in tasks]
+            for relation, future in futures:
+                results[relation.name].extend(future.result())
+
+    for relation in relations:
+        related = results[relation.name]
+        relation.stitch(instances, related)
+        if tree[relation.name] and related:
+            prefetch_across_databases(
+                related, *tree[relation.name], batch_size=batch_size, max_workers=max_workers,
+            )
+    return instances
@@ -0,0 +1,183 @@
+import itertools
+import logging
+import re
+import threading
+import time
+from threading import local
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger(__name__)
+
+
+DB_REPLICA_ROUTER = getattr(settings, 'DB_REPLICA_ROUTER', {})
+"""
+example:
+    DB_REPLICA_ROUTER = {
+        'default': {
+            'replica_1': 2,  # weight
+            'replica_2': 1,
+        },
+        'analytics': (
+            'analytics_replica',
+        ),
+    }
+"""
+
+# Replicas lagging more than this (seconds) aren't read from
+DB_REPLICA_MAX_LAG = getattr(settings, 'DB_REPLICA_MAX_LAG', 5)
+# Seconds a measured lag is trusted before it's probed again
+DB_REPLICA_LAG_CHECK_INTERVAL = getattr(settings, 'DB_REPLICA_LAG_CHECK_INTERVAL', 10)
+# Seconds a session (or a thread) keeps reading from the primary it wrote to
+DB_REPLICA_STICKY_SECONDS = getattr(settings, 'DB_REPLICA_STICKY_SECONDS', 15)
+
+LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+
+# Statements that don't write, anything else pins the reads to the primary
+READ_RE = re.compile(r'^\s*(SELECT|SHOW|SET|SAVEPOINT|RELEASE|ROLLBACK|COMMIT|BEGIN|EXPLAIN)\b', re.IGNORECASE)
+
+
+class ReplicaSet(object):
+    """Weighted round robin over the replicas of one database, skipping lagging ones"""
+
+    def __init__(self, primary, replicas, max_lag=DB_REPLICA_MAX_LAG, check_interval=DB_REPLICA_LAG_CHECK_INTERVAL):
+        if not isinstance(replicas, dict):
+            replicas = {alias: 1 for alias in replicas}
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        schedule = [alias for alias, weight in sorted(replicas.items()) for _ in range(weight)]
+        self._size = len(schedule)
+        self._cycle = itertools.cycle(schedule)
+        self._lock = threading.Lock()
+        self._probing = set()
+        # alias -> (monotonic time of the probe, lag in seconds)
+        self._lags = {}
+
+    def measure_lag(self, alias):
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            return 0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning('Unable to measure the lag of replica %s', alias, exc_info=True)
+            return float('inf')
+
+    def get_lag(self, alias):
+        checked_at, lag = self._lags.get(alias, (None, None))
+        if checked_at is not None and time.monotonic() - checked_at < self.check_interval:
+            return lag
+        with self._lock:
+            if alias in self._probing:
+                # another thread is probing it, go with the last known lag
+                return float('inf') if lag is None else lag
+            self._probing.add(alias)
+        try:
+            lag = self.measure_lag(alias)
+            self._lags[alias] = (time.monotonic(), lag)
+        finally:
+            self._probing.discard(alias)
+        return lag
+
+    def choose(self):
+        """Returns the next healthy replica, None when they all lag"""
+        for _ in range(self._size):
+            with self._lock:
+                alias = next(self._cycle)
+            if self.get_lag(alias) <= self.max_lag:
+                return alias
+        return None
+
+
+_REPLICA_SETS = {}
+# replica alias -> primary alias
+_PRIMARIES = {}
+_PINNING = local()
+
+
+def load_replica_sets():
+    global DB_REPLICA_ROUTER
+    DB_REPLICA_ROUTER = getattr(settings, 'DB_REPLICA_ROUTER', {})
+    _REPLICA_SETS.clear()
+    _PRIMARIES.clear()
+    for primary, replicas in DB_REPLICA_ROUTER.items():
+        _REPLICA_SETS[primary] = ReplicaSet(primary, replicas)
+        _PRIMARIES.update((alias, primary) for alias in replicas)
+
+
+def get_replica_set(primary):
+    return _REPLICA_SETS.get(primary)
+
+
+def is_replica(alias):
+    return alias in _PRIMARIES
+
+
+def get_primary(alias):
+    return _PRIMARIES.get(alias, alias)
+
+
+def _get_pinned():
+    if not hasattr(_PINNING, 'pinned'):
+        # alias -> monotonic time the pin expires
+        _PINNING.pinned = {}
+        _PINNING.written = set()
+    return _PINNING
+
+
+def pin(alias, written=False, seconds=DB_REPLICA_STICKY_SECONDS):
+    """
+    Sends the reads of `alias` to the primary for `seconds`, or until the
+    end of the request, whichever comes first
+    """
+    pinning = _get_pinned()
+    pinning.pinned[alias] = max(pinning.pinned.get(alias, 0), time.monotonic() + seconds)
+    if written:
+        pinning.written.add(alias)
+
+
+def is_pinned(alias):
+    expires = _get_pinned().pinned.get(alias)
+    return expires is not None and time.monotonic() < expires
+
+
+def get_written():
+    return set(_get_pinned().written)
+
+
+def reset_pinning(**kwargs):
+    _PINNING.pinned = {}
+    _PINNING.written = set()
+
+
+def pin_on_write(execute, sql, params, many, context):
+    """execute_wrapper pinning the reads to the primary a statement writes to"""
+    if not READ_RE.match(sql):
+        pin(context['connection'].alias, written=True)
+    return execute(sql, params, many, context)
+
+
+def watch_writes(connection, **kwargs):
+    """Installs `pin_on_write` on the connections of the primaries having replicas"""
+    if connection.alias in _REPLICA_SETS and pin_on_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(pin_on_write)
+
+
+load_replica_sets()
+connection_created.connect(watch_writes)
+# the pins of a request don't outlive it, even without ReplicaPinningMiddleware
+request_started.connect(reset_pinning)
+request_finished.connect(reset_pinning)
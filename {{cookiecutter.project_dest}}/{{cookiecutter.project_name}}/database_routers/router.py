@@ -1,5 +1,12 @@
 from django.apps import apps
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+
+from .replicas import (
+    get_primary, get_replica_set, is_pinned,
+    is_replica, load_replica_sets, watch_writes,
+)
 
 
 DB_APP_ROUTER = getattr(settings, 'DB_APP_ROUTER', {})
@@ -27,17 +34,63 @@ example:
     }
 """
 
+# Settings the routing decisions depend on
+ROUTER_SETTINGS = ('DB_APP_ROUTER', 'DB_MODEL_ROUTER', 'DB_REPLICA_ROUTER', 'DATABASES', 'ALLOW_DATABASE_UNION')
+
 
 _ROUTER_CACHE = {}
+# label -> db name, inverted DB_APP_ROUTER / DB_MODEL_ROUTER
+_APP_INDEX = {}
+_MODEL_INDEX = {}
+# final verdicts of db_for_read / db_for_write, and of allow_migrate
+_VERDICT_CACHE = {}
+_MIGRATE_CACHE = {}
+
+
+def _invert(setting_dict):
+    index = {}
+    for db_name, values in setting_dict.items():
+        for value in values:
+            # the first database listing a label wins, like a linear scan
+            index.setdefault(value, db_name)
+    return index
+
+
+def clear_router_cache(**kwargs):
+    """Reloads the router settings and forgets every decision taken"""
+    global DB_APP_ROUTER, DB_MODEL_ROUTER
+    if kwargs.get('setting', ROUTER_SETTINGS[0]) not in ROUTER_SETTINGS:
+        return
+    DB_APP_ROUTER = getattr(settings, 'DB_APP_ROUTER', {})
+    DB_MODEL_ROUTER = getattr(settings, 'DB_MODEL_ROUTER', {})
+    for cache in (_ROUTER_CACHE, _VERDICT_CACHE, _MIGRATE_CACHE):
+        cache.clear()
+    _APP_INDEX.clear()
+    _APP_INDEX.update(_invert(DB_APP_ROUTER))
+    _MODEL_INDEX.clear()
+    _MODEL_INDEX.update(_invert(DB_MODEL_ROUTER))
+    load_replica_sets()
+
+
+_APP_INDEX.update(_invert(DB_APP_ROUTER))
+_MODEL_INDEX.update(_invert(DB_MODEL_ROUTER))
+# override_settings() in tests
+setting_changed.connect(clear_router_cache)
 
 
 class Router(object):
 
     @classmethod
     def _get_db_name_from_settings(cls, setting_dict, value):
-        for db_name, values in setting_dict.items():
-            if value in values:
-                return db_name
+        if setting_dict is DB_APP_ROUTER:
+            return _APP_INDEX.get(value)
+        if setting_dict is DB_MODEL_ROUTER:
+            return _MODEL_INDEX.get(value)
+        return _invert(setting_dict).get(value)
+
+    @classmethod
+    def clear_cache(cls):
+        clear_router_cache()
 
     def _get_db_for_app(self, app_label):
         return (
@@ -68,21 +121,56 @@ class Router(object):
             assert db_exists, f"Database {db_name} doesn't exist, but it's referenced in DB ROUTER settings"
         return db_exists
 
-    def db_for_read(self, model, **hints):
+    def _get_verdict(self, model):
+        # reads and writes go to the same database
+        try:
+            return _VERDICT_CACHE[model]
+        except KeyError:
+            pass
         db = self._get_db_for_model(model)
-        if self.db_exists(db):
+        verdict = db if self.db_exists(db) else None
+        _VERDICT_CACHE[model] = verdict
+        return verdict
+
+    def db_for_read(self, model, **hints):
+        db = self._get_verdict(model)
+        primary = db or 'default'
+        replica_set = get_replica_set(primary)
+        if replica_set is None or is_pinned(primary):
             return db
-        return
+        return replica_set.choose() or db
 
     def db_for_write(self, model, **hints):
-        db = self._get_db_for_model(model)
-        if self.db_exists(db):
-            return db
-        return
+        db = self._get_verdict(model)
+        primary = db or 'default'
+        if get_replica_set(primary) is not None:
+            # read your writes: the statements that do write pin the reads
+            # to the primary, the replicas may not have them yet
+            watch_writes(connections[primary])
+        return db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a replica holds the same rows as its primary
+        db1, db2 = obj1._state.db, obj2._state.db
+        if db1 is None or db2 is None:
+            return None
+        return True if get_primary(db1) == get_primary(db2) else None
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         if 'target_db' in hints:
             return db == hints['target_db']
+        if is_replica(db):
+            # replicas get their schema from the primary
+            return False
+        key = (db, app_label, model_name)
+        try:
+            return _MIGRATE_CACHE[key]
+        except KeyError:
+            pass
+        verdict = _MIGRATE_CACHE[key] = self._allow_migrate(db, app_label, model_name)
+        return verdict
+
+    def _allow_migrate(self, db, app_label, model_name):
         try:
             model = apps.get_model(app_label, model_name)
         except ValueError:
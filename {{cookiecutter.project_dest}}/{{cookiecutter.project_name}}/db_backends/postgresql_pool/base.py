@@ -0,0 +1,39 @@
+"""
+PostgreSQL backend checking its connections out of a per process pool.
+
+    DATABASES = {
+        'default': {
+            'ENGINE': '{{cookiecutter.project_name}}.db_backends.postgresql_pool',
+            ...
+            'CONN_MAX_AGE': 0,  # hand the connection back at the end of each request
+            'POOL': {
+                'MIN_SIZE': 1,
+                'MAX_SIZE': 2,  # uwsgi threads
+                'TIMEOUT': 10,  # seconds to wait for a free connection
+                'MAX_IDLE': 300,
+                'MAX_LIFETIME': 3600,
+                'CHECK_INTERVAL': 30,  # ping connections idle for longer
+            },
+        },
+    }
+"""
+from django.db.backends.postgresql import base
+
+from .pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict)
+        connection = pool.getconn(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # a reused connection may come from a wrapper with other OPTIONS
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                get_pool(self.alias, self.settings_dict).putconn(self.connection)
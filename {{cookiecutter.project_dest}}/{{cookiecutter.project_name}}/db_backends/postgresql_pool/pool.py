@@ -0,0 +1,236 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of the psycopg2 connections of one database alias.
+
+    The most recently returned idle connection is handed out first, so the
+    ones which aren't needed stay idle and get closed after `max_idle`
+    seconds, down to `min_size`. A connection idle for more than
+    `check_interval` seconds is pinged before it's handed out.
+    """
+
+    def __init__(self, alias, min_size=0, max_size=4, timeout=10, max_idle=300, max_lifetime=3600,
+                 check_interval=30):
+        if max_size < max(min_size, 1):
+            raise ValueError('POOL MAX_SIZE must be at least 1 and MIN_SIZE', max_size)
+        self.alias = alias
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_interval = check_interval
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # (connection, created, returned) of the idle connections
+        self._idle = deque()
+        # connection -> created, of every open connection of the pool
+        self._created = {}
+        self._opening = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def size(self):
+        return len(self._created) + self._opening
+
+    def getconn(self, connect):
+        """Checks out a connection, opening one with `connect()` when there's room"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            with self._condition:
+                self._reap()
+                while not self._idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout('No connection became available in time', self.alias, self.timeout)
+                    waited = True
+                    self._condition.wait(remaining)
+                if self._idle:
+                    connection, created, returned = self._idle.pop()
+                else:
+                    connection = None
+                    self._opening += 1
+            if connection is None:
+                try:
+                    connection = connect()
+                finally:
+                    with self._condition:
+                        self._opening -= 1
+                        if connection is not None:
+                            self._created[connection] = time.monotonic()
+                        self._condition.notify()
+                break
+            if self._is_healthy(connection, returned):
+                break
+            self._discard(connection)
+        self._record_wait(time.monotonic() - start, waited)
+        return connection
+
+    def putconn(self, connection):
+        """Returns a connection to the pool, closing it when it can't be reused"""
+        with self._condition:
+            created = self._created.get(connection)
+        if created is None:
+            connection.close()
+            return
+        now = time.monotonic()
+        if now - created > self.max_lifetime or not self._reset(connection):
+            self._discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, created, now))
+            self._condition.notify()
+
+    def _reset(self, connection):
+        """
+        Rolls back and drops the session state (settings, temporary tables,
+        prepared statements, advisory locks, LISTEN) so that the next checkout
+        starts afresh. Returns whether the connection can be reused.
+        """
+        if connection.closed:
+            return False
+        try:
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            # DISCARD ALL can't run in a transaction, Django sets autocommit again on checkout
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute('DISCARD ALL')
+        except psycopg2.Error:
+            return False
+        return connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+
+    def _is_healthy(self, connection, returned):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            logger.info('Discarding a broken connection to %s', self.alias)
+            return False
+        return True
+
+    def _discard(self, connection):
+        with self._condition:
+            self._created.pop(connection, None)
+            self._condition.notify()
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _reap(self):
+        """Closes the connections idle or open for too long, oldest first. Holds the lock."""
+        now = time.monotonic()
+        while self._idle and self.size > self.min_size:
+            connection, created, returned = self._idle[0]
+            if now - returned <= self.max_idle and now - created <= self.max_lifetime:
+                break
+            self._idle.popleft()
+            self._created.pop(connection, None)
+            try:
+                connection.close()
+            except psycopg2.Error:
+                pass
+
+    def _record_wait(self, wait_time, waited):
+        with self._condition:
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+            if waited:
+                self.waits += 1
+        if waited:
+            logger.debug('Waited %.3fs for a connection to %s', wait_time, self.alias)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'in_use': self.size - len(self._idle),
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_time_ms': self.wait_time * 1000,
+                'max_wait_time_ms': self.max_wait_time * 1000,
+            }
+
+    def close(self):
+        """Closes the idle connections"""
+        with self._condition:
+            while self._idle:
+                connection, created, returned = self._idle.popleft()
+                self._created.pop(connection, None)
+                connection.close()
+
+
+# DATABASES[alias]['POOL'] key -> ConnectionPool argument
+POOL_OPTIONS = {
+    'MIN_SIZE': 'min_size',
+    'MAX_SIZE': 'max_size',
+    'TIMEOUT': 'timeout',
+    'MAX_IDLE': 'max_idle',
+    'MAX_LIFETIME': 'max_lifetime',
+    'CHECK_INTERVAL': 'check_interval',
+}
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    """Returns the pool of `alias` in this process, configured by DATABASES[alias]['POOL']"""
+    pool = _POOLS.get(alias)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _POOLS_LOCK:
+        pool = _POOLS.get(alias)
+        # connections inherited through a fork belong to the parent, leave them be
+        if pool is None or pool.pid != os.getpid():
+            config = settings_dict.get('POOL') or {}
+            unknown = set(config) - set(POOL_OPTIONS)
+            if unknown:
+                raise ValueError('Unknown POOL options', alias, sorted(unknown))
+            pool = _POOLS[alias] = ConnectionPool(
+                alias, **{POOL_OPTIONS[key]: value for key, value in config.items()},
+            )
+        return pool
+
+
+def get_pool_stats():
+    return {alias: pool.stats() for alias, pool in _POOLS.items() if pool.pid == os.getpid()}
+
+
+def watchman_check():
+    """django-watchman check with the connection pools of this process"""
+    return {'connection_pools': {'ok': True, 'pools': get_pool_stats()}}
@@ -3,15 +3,17 @@ from __future__ import with_statement
 import importlib
 from collections import OrderedDict
 from datetime import datetime
+from wsgiref.util import FileWrapper
 
 from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import six
 
 # third party
-import tablib
 from import_export.tmp_storages import TempFolderStorage
 
 from . import formats as base_formats
+from .storage import open_tmp_file, save_upload
 
 
 SKIP_ADMIN_LOG = getattr(settings, 'IMPORT_EXPORT_SKIP_ADMIN_LOG', False)
@@ -89,16 +91,29 @@ class WorkbookImportExportMixin(object):
             )
         return filename
 
-    def get_export_data(self, file_format, *args, **kwargs):
+    def get_export_sheets(self, *args, **kwargs):
         """
-        Returns file_format representation for given queryset.
+        Yields the (title, headers, rows) of every resource, rows exported lazily.
+        after_export() isn't called, there's no dataset to give it.
         """
-        book = tablib.Databook()
         for resource in self.resources:
-            dataset = resource.export(queryset=None, *args, **kwargs)
-            book.add_sheet(dataset)
-        export_data = file_format.export_databook(databook=book)
-        return export_data
+            resource.before_export(None, *args, **kwargs)
+            yield resource.sheet_title, resource.get_export_headers(), resource.iter_export()
+
+    def get_export_data(self, file_format, *args, **kwargs):
+        """
+        Returns file_format representation of the workbook, as a temporary
+        file written row by row.
+        """
+        return file_format.export_workbook(self.get_export_sheets(*args, **kwargs))
+
+    def get_export_response(self, file_format=None, *args, **kwargs):
+        if file_format is None:
+            file_format = base_formats.XLSXBook()
+        export_data = self.get_export_data(file_format, *args, **kwargs)
+        response = StreamingHttpResponse(FileWrapper(export_data), content_type=file_format.get_content_type())
+        response['Content-Disposition'] = 'attachment; filename="%s"' % self.get_export_filename(file_format)
+        return response
 
     def import_action(self, import_file, *args, **kwargs):
         '''
@@ -112,17 +127,16 @@ class WorkbookImportExportMixin(object):
         # first always write the uploaded file to disk as it may be a
         # memory file or else based on settings upload handlers
         tmp_storage = self.get_tmp_storage_class()()
-        data = bytes()
-        for chunk in import_file.chunks():
-            data += chunk
-        tmp_storage.save(data, input_format.get_read_mode())
-
-        # then read the file, using the proper format-specific mode
-        # warning, big files may exceed memory
-        data = tmp_storage.read(input_format.get_read_mode())
-        databook = tablib.Databook()
-        input_format.fill_databook(databook, data)
-        results = self.run_import(databook)
+        save_upload(tmp_storage, import_file)
+
+        # then read the file from where it was saved
+        # rows are read lazily, a batch at a time, see ExcelModelResource.import_data_inner
+        with open_tmp_file(tmp_storage) as tmp_file:
+            databook = input_format.open_databook(tmp_file)
+            try:
+                results = self.run_import(databook, dry_run=True)
+            finally:
+                databook.close()
         tmp_storage.remove()
 
         return results
@@ -132,15 +146,17 @@ class WorkbookImportExportMixin(object):
         Perform the actual import action (after the user has confirmed the import)
         """
         results = []
-        input_format = base_formats.XLSXBook
+        input_format = base_formats.XLSXBook()
         tmp_storage = self.get_tmp_storage_class()(name=import_file_name)
-        data = tmp_storage.read(input_format.get_read_mode())
-        dataset = input_format.create_dataset(data)
-        # databook = create databook (data)
-        # for dataset in databook.datasets:
-        #   resource = self.title_resource_map[dataset.title]
-        #   results.append[self.process_dataset(dataset, resource)]
-        results.append(self.process_dataset(dataset, *args, **kwargs))
+        with open_tmp_file(tmp_storage) as tmp_file:
+            databook = input_format.open_databook(tmp_file)
+            try:
+                # for dataset in databook.sheets():
+                #   resource = self.title_resource_map[dataset.title]
+                #   results.append[self.process_dataset(dataset, resource)]
+                results.append(self.process_dataset(databook.active(), *args, **kwargs))
+            finally:
+                databook.close()
         tmp_storage.remove()
         return self.process_results(results)
 
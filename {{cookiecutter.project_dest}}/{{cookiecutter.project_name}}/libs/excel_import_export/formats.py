@@ -24,5 +24,17 @@ class XLSXBook(base_formats.XLSX):
     def fill_databook(self, databook, import_file):
         return self.get_format().import_book(databook, import_file)
 
+    def open_databook(self, import_file):
+        """
+        Returns a LazyBook of the file, closed by the caller.
+        """
+        return self.get_format().open_book(import_file)
+
     def export_databook(self, databook, **kwargs):
         return self.get_format().export_book(databook, **kwargs)
+
+    def export_workbook(self, sheets, **kwargs):
+        """
+        Returns a temporary file with the (title, headers, rows) sheets.
+        """
+        return self.get_format().write_book(sheets, **kwargs)
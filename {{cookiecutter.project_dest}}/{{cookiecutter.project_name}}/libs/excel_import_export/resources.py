@@ -1,7 +1,15 @@
 import logging
 import traceback
+from collections import defaultdict
 from copy import deepcopy
+from functools import reduce
+from itertools import islice
+from operator import or_
 
+from django.core.exceptions import (
+    FieldDoesNotExist, ObjectDoesNotExist, ValidationError,
+)
+from django.db.models import F, Model, Q
 from django.db.models.query import QuerySet
 from django.db.transaction import (
     savepoint, savepoint_commit, savepoint_rollback,
@@ -21,65 +29,259 @@ from . import fields, utils
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
 
+# a unique key matching several instances, looked up with .get() to raise as before
+AMBIGUOUS = object()
+
+
+def get_model_field(model, attribute):
+    """The concrete field a field name or lookup path ends on, None when there's none"""
+    field = None
+    try:
+        for name in attribute.split('__'):
+            if field is not None:
+                model = field.related_model
+            field = model._meta.get_field(name)
+    except (FieldDoesNotExist, AttributeError):
+        return None
+    if field.is_relation:
+        field = getattr(field, 'target_field', None) if field.concrete else None
+    return field
+
+
+def normalize(value, model_field=None):
+    """
+    Comparable form of a cleaned value and of the same value read from the
+    database, both going through the model field as a query parameter would
+    """
+    if isinstance(value, Model):
+        value = value.pk
+    if value is None:
+        return None
+    if model_field is not None:
+        try:
+            value = model_field.get_prep_value(model_field.to_python(value))
+        except (TypeError, ValueError, ValidationError):
+            pass
+    return None if value is None else force_text(value)
+
+
 class ExcelModelInstanceLoader(instance_loaders.ModelInstanceLoader):
+    """
+    `load_batch` fetches the existing instances of a batch of rows with one
+    query per chunk of unique keys, `get_instance` is then served from them,
+    the rows being cleaned once. A key met a second time in a batch is looked
+    up in the database, as the row before may have created or deleted its
+    instance, and so are the keys the batch didn't find when a row it read
+    didn't map back onto the requested keys.
+    """
+    #: unique keys per query
+    chunk_size = 500
+
+    def __init__(self, *args, **kwargs):
+        super(ExcelModelInstanceLoader, self).__init__(*args, **kwargs)
+        self.instances = None
+        self.served = set()
+        # id(row) -> (row, cleaned value, error), see clean_batch
+        self.cleaned = {}
+        # (model, attribute) -> model field
+        self._model_fields = {}
+
+    def clean_batch(self, rows, clean):
+        """Cleans the rows once for load_batch, `get_cleaned` hands them over to get_instance"""
+        self.cleaned = {}
+        for row in rows:
+            try:
+                self.cleaned[id(row)] = (row, clean(row), None)
+            except Exception as e:
+                # raised by get_instance, on its row
+                self.cleaned[id(row)] = (row, None, e)
+        return [value for row, value, error in self.cleaned.values() if error is None]
+
+    def get_cleaned(self, row, clean):
+        """clean(row), as clean_batch got it, raises its error"""
+        cached = self.cleaned.pop(id(row), None)
+        if cached is None or cached[0] is not row:
+            return clean(row)
+        row, value, error = cached
+        if error is not None:
+            raise error
+        return value
+
+    def get_group(self, row):
+        """The instances of a group of rows are read from the same queryset"""
+        return None
+
+    def get_group_queryset(self, group):
+        return self.resource.get_queryset()
+
+    def get_params(self, row):
+        params = {}
+        for key in self.resource.unique_key_field().fields:
+            field = self.resource.fields[key]
+            if isinstance(field, fields.ExcelField):
+                fval = field.clean(row, self.resource.resource_map)
+            else:
+                fval = field.clean(row)
+            if fval:
+                params[field.attribute] = fval
+        return params
+
+    def clean_key(self, row):
+        """(group, params) of a row, params None when a key value has no instance"""
+        group = self.get_group(row)
+        try:
+            return group, self.get_params(row)
+        except self.get_group_queryset(group).model.DoesNotExist:
+            return group, None
+
+    def get_model_field(self, group, attribute):
+        model = self.get_group_queryset(group).model
+        if (model, attribute) not in self._model_fields:
+            self._model_fields[model, attribute] = get_model_field(model, attribute)
+        return self._model_fields[model, attribute]
+
+    def get_key(self, group, params):
+        attributes = tuple(sorted(params))
+        return group, attributes, self.get_values_key(group, attributes, [params[name] for name in attributes])
+
+    def get_values_key(self, group, attributes, values):
+        return tuple(
+            normalize(value, self.get_model_field(group, attribute))
+            for attribute, value in zip(attributes, values)
+        )
 
-    def get_instance(self, row):
+    def fetch_instance(self, group, params):
         try:
-            params = {}
-            for key in self.resource.unique_key_field().fields:
-                field = self.resource.fields[key]
-                if isinstance(field, fields.ExcelField):
-                    fval = field.clean(row, self.resource.resource_map)
+            return self.get_group_queryset(group).get(**params)
+        except ObjectDoesNotExist:
+            return None
+
+    def load_batch(self, rows):
+        lookups = defaultdict(dict)
+        for group, params in self.clean_batch(rows, self.clean_key):
+            if params:
+                key = self.get_key(group, params)
+                lookups[key[:2]][key] = params
+
+        self.instances = {}
+        self.served = set()
+        for (group, attributes), keyed_params in lookups.items():
+            keys = list(keyed_params)
+            mapped = True
+            for start in range(0, len(keys), self.chunk_size):
+                chunk = [keyed_params[key] for key in keys[start:start + self.chunk_size]]
+                if len(attributes) == 1:
+                    query = Q(**{'%s__in' % attributes[0]: [params[attributes[0]] for params in chunk]})
                 else:
-                    fval = field.clean(row)
-                if fval:
-                    params[field.attribute] = fval
-            return self.resource.get_queryset().get(**params) if params else None
-        except self.resource._meta.model.DoesNotExist:
+                    query = reduce(or_, (Q(**params) for params in chunk))
+                # the unique key as the database has it, joins included
+                annotations = {'_unique_key_%d' % i: F(attribute) for i, attribute in enumerate(attributes)}
+                for instance in self.get_group_queryset(group).filter(query).annotate(**annotations):
+                    values = [getattr(instance, name) for name in annotations]
+                    key = (group, attributes, self.get_values_key(group, attributes, values))
+                    mapped = mapped and key in keyed_params
+                    self.instances[key] = AMBIGUOUS if key in self.instances else instance
+            if mapped:
+                # the keys not found have no instance, unless the keys
+                # of the database and of the rows don't compare
+                for key in keys:
+                    self.instances.setdefault(key, None)
+
+    def get_instance(self, row):
+        group, params = self.get_cleaned(row, self.clean_key)
+        if not params:
             return None
+        key = self.get_key(group, params)
+        if self.instances is None or key not in self.instances or key in self.served:
+            return self.fetch_instance(group, params)
+        self.served.add(key)
+        instance = self.instances[key]
+        if instance is AMBIGUOUS:
+            return self.fetch_instance(group, params)
+        return instance
 
 
 class ExcelMPTTModelInstanceLoader(ExcelModelInstanceLoader):
+    """Batched by name, the parent narrows the instances of a name down"""
 
-    def get_instance(self, row):
+    def clean(self, row):
+        """(name, parent) of a row, None when a value has no instance"""
+        import_field = self.resource.fields['name']
+        parent_field = self.resource.fields['parent']
         try:
-            qs = self.get_queryset()
-
-            import_field = self.resource.fields['name']
-            parent_field = self.resource.fields['parent']
+            return import_field.clean(row), parent_field.clean(row, self.resource.resource_map)
+        except self.resource._meta.model.DoesNotExist:
+            return None
 
-            parent_val = parent_field.clean(row, self.resource.resource_map)
+    def fetch_instance(self, import_val, parent_val):
+        try:
+            qs = self.get_queryset()
             if parent_val:
                 qs = qs.filter(parent=parent_val)
-            import_val = import_field.clean(row)
-            return qs.get(**{import_field.attribute: import_val})
-
+            return qs.get(**{self.resource.fields['name'].attribute: import_val})
         except self.resource._meta.model.DoesNotExist:
             return None
 
+    def load_batch(self, rows):
+        names = list({cleaned[0] for cleaned in self.clean_batch(rows, self.clean) if cleaned is not None})
+
+        attribute = self.resource.fields['name'].attribute
+        requested = {self.normalize_name(name) for name in names}
+        # name -> [(parent id, instance)]
+        self.instances = {}
+        self.served = set()
+        mapped = True
+        for start in range(0, len(names), self.chunk_size):
+            queryset = self.get_queryset().filter(**{'%s__in' % attribute: names[start:start + self.chunk_size]})
+            for instance in queryset.annotate(_unique_key=F(attribute)):
+                name = self.normalize_name(instance._unique_key)
+                mapped = mapped and name in requested
+                self.instances.setdefault(name, []).append((normalize(instance.parent_id), instance))
+        if mapped:
+            # the names not found have no instance
+            for name in requested:
+                self.instances.setdefault(name, [])
+
+    def normalize_name(self, value):
+        return normalize(value, self.get_model_field(None, self.resource.fields['name'].attribute))
+
+    def get_instance(self, row):
+        cleaned = self.get_cleaned(row, self.clean)
+        if cleaned is None:
+            return None
+        import_val, parent_val = cleaned
+        name = self.normalize_name(import_val)
+        if self.instances is None or name not in self.instances or name in self.served:
+            return self.fetch_instance(import_val, parent_val)
+        self.served.add(name)
+        parent_id = normalize(parent_val) if parent_val else None
+        candidates = [
+            instance for instance_parent_id, instance in self.instances[name]
+            if parent_id is None or instance_parent_id == parent_id
+        ]
+        if len(candidates) > 1:
+            return self.fetch_instance(import_val, parent_val)
+        return candidates[0] if candidates else None
+
 
 class ExcelGenericModelInstanceLoader(ExcelModelInstanceLoader):
+    """Batched per content type"""
 
     def get_queryset(self, model_cls):
         return model_cls.all_objects.all()
 
-    def get_instance(self, row):
+    def get_group(self, row):
         content_type_field = self.resource.fields['content_type']
-        content_type = content_type_field.clean(row, self.resource.resource_map)
-        model_cls = content_type.model_class()
+        return content_type_field.clean(row, self.resource.resource_map)
+
+    def get_group_queryset(self, content_type):
+        # as ContentType.get_object_for_this_type reads them
+        return content_type.model_class()._base_manager.using(content_type._state.db)
 
+    def fetch_instance(self, content_type, params):
         try:
-            params = {}
-            for key in self.resource.unique_key_field().fields:
-                field = self.resource.fields[key]
-                if isinstance(field, fields.ExcelField):
-                    fval = field.clean(row, self.resource.resource_map)
-                else:
-                    fval = field.clean(row)
-                if fval:
-                    params[field.attribute] = fval
-            return content_type.get_object_for_this_type(**params) if params else None
-        except model_cls.DoesNotExist:
+            return content_type.get_object_for_this_type(**params)
+        except content_type.model_class().DoesNotExist:
             return None
 
 
@@ -107,6 +309,9 @@ class ExcelModelResource(resources.ModelResource):
         }
         self.set_col_map()
 
+    #: rows read from the dataset at a time
+    import_batch_size = 1000
+
     class Meta:
         instance_loader_class = ExcelModelInstanceLoader
 
@@ -173,7 +378,38 @@ class ExcelModelResource(resources.ModelResource):
         if collect_failed_rows:
             result.add_dataset_headers(dataset.headers)
 
-        for idx, row in enumerate(dataset.dict):
+        for batch in self.iter_import_batches(dataset):
+            self.import_batch(
+                batch, instance_loader, result, dry_run, raise_errors, using_transactions, collect_failed_rows,
+                **kwargs,
+            )
+        try:
+            with atomic_if_using_transaction(using_transactions):
+                self.after_import(dataset, result, using_transactions, dry_run, **kwargs)
+        except Exception as e:
+            logging.exception(e)
+            tb_info = traceback.format_exc()
+            result.append_base_error(self.get_error_result_class()(e, tb_info))
+            if raise_errors:
+                raise
+
+        if using_transactions:
+            if dry_run or result.has_errors():
+                savepoint_rollback(sp1)
+            else:
+                savepoint_commit(sp1)
+
+        return result
+
+    def import_batch(self, batch, instance_loader, result, dry_run, raise_errors, using_transactions,
+                     collect_failed_rows, **kwargs):
+        """
+        Imports a batch of (index, row) of `iter_import_batches` into `result`,
+        the instances of the rows being loaded at once when the loader can.
+        """
+        if hasattr(instance_loader, 'load_batch'):
+            instance_loader.load_batch([row for idx, row in batch])
+        for idx, row in batch:
             with atomic_if_using_transaction(using_transactions):
                 row_result = self.import_row(
                     row,
@@ -192,23 +428,18 @@ class ExcelModelResource(resources.ModelResource):
             if (row_result.import_type != RowResult.IMPORT_TYPE_SKIP or
                     self._meta.report_skipped):
                 result.append_row_result(row_result)
-        try:
-            with atomic_if_using_transaction(using_transactions):
-                self.after_import(dataset, result, using_transactions, dry_run, **kwargs)
-        except Exception as e:
-            logging.exception(e)
-            tb_info = traceback.format_exc()
-            result.append_base_error(self.get_error_result_class()(e, tb_info))
-            if raise_errors:
-                raise
-
-        if using_transactions:
-            if dry_run or result.has_errors():
-                savepoint_rollback(sp1)
-            else:
-                savepoint_commit(sp1)
 
-        return result
+    def iter_import_batches(self, dataset):
+        """
+        Yields lists of (index, row) of at most `import_batch_size` rows.
+        `dataset.dict` may be a generator, see xlsx.LazySheet.
+        """
+        rows = enumerate(dataset.dict)
+        while True:
+            batch = list(islice(rows, self.import_batch_size))
+            if not batch:
+                return
+            yield batch
 
     def import_row(self, row, instance_loader, using_transactions=True, dry_run=False, **kwargs):
         """
@@ -326,18 +557,28 @@ class ExcelModelResource(resources.ModelResource):
         headers = self.get_export_headers()
         data = tablib.Dataset(headers=headers, title=self.sheet_title)
 
+        for row in self.iter_export(queryset):
+            data.append(row)
+
+        self.after_export(queryset, data, *args, **kwargs)
+
+        return data
+
+    def iter_export(self, queryset=None):
+        """
+        Yields the exported rows one at a time, filling the row map as it goes.
+        """
+        if queryset is None:
+            queryset = self.get_queryset()
+
         if isinstance(queryset, QuerySet):
             iterable = queryset.iterator()
         else:
             iterable = queryset
         for idx, obj in enumerate(iterable):
-            data.append(self.export_resource(obj=obj, row_no=idx+2))
+            yield self.export_resource(obj=obj, row_no=idx+2)
             self.resource_map[self.sheet_title]['row_map'][str(obj)] = idx + 2
 
-        self.after_export(queryset, data, *args, **kwargs)
-
-        return data
-
 
 class ExcelMPTTModelResource(ExcelModelResource):
 
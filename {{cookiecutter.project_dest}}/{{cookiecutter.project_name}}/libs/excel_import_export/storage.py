@@ -1,2 +1,31 @@
+from io import BytesIO
+from uuid import uuid4
+
+from django.core.files.storage import default_storage
+
 # third party
-from import_export.tmp_storages import MediaStorage
+from import_export.tmp_storages import MediaStorage, TempFolderStorage
+
+
+def save_upload(tmp_storage, upload):
+    """Saves an UploadedFile to `tmp_storage` a chunk at a time, when the storage is a file"""
+    if isinstance(tmp_storage, TempFolderStorage):
+        with tmp_storage.open('wb') as tmp_file:
+            for chunk in upload.chunks():
+                tmp_file.write(chunk)
+    elif isinstance(tmp_storage, MediaStorage):
+        if not tmp_storage.name:
+            tmp_storage.name = uuid4().hex
+        default_storage.save(tmp_storage.get_full_path(), upload)
+    else:
+        # e.g. CacheStorage, which holds the whole content anyway
+        tmp_storage.save(b''.join(upload.chunks()), 'wb')
+
+
+def open_tmp_file(tmp_storage):
+    """Returns the binary file saved in `tmp_storage`, opened by its path when it has one"""
+    if isinstance(tmp_storage, TempFolderStorage):
+        return tmp_storage.open('rb')
+    if isinstance(tmp_storage, MediaStorage):
+        return default_storage.open(tmp_storage.get_full_path(), 'rb')
+    return BytesIO(tmp_storage.read('rb'))
@@ -1,8 +1,11 @@
+import tempfile
+from collections import OrderedDict
 from io import BytesIO
 
 # third party
 import openpyxl
 import tablib
+from openpyxl.cell import WriteOnlyCell
 from tablib.compat import unicode
 
 
@@ -10,6 +13,10 @@ Workbook = openpyxl.workbook.Workbook
 ExcelWriter = openpyxl.writer.excel.ExcelWriter
 get_column_letter = openpyxl.utils.get_column_letter
 
+# shared by every cell they style
+bold = openpyxl.styles.Font(bold=True)
+wrap_text = openpyxl.styles.Alignment(wrap_text=True)
+
 
 title = 'xlsx'
 extensions = ('xlsx',)
@@ -27,32 +34,36 @@ def detect(stream):
 def export_set(dataset, freeze_panes=True):
     """Returns XLSX representation of Dataset."""
 
-    wb = Workbook()
-    ws = wb.worksheets[0]
-    ws.title = dataset.title if dataset.title else 'Tablib Dataset'
-
-    dset_sheet(dataset, ws, freeze_panes=freeze_panes)
-
-    stream = BytesIO()
-    wb.save(stream)
-    return stream.getvalue()
+    title = dataset.title if dataset.title else 'Tablib Dataset'
+    headers, rows = dset_rows(dataset)
+    return write_book([(title, headers, rows)], freeze_panes=freeze_panes).read()
 
 
 def export_book(databook, freeze_panes=True):
     """Returns XLSX representation of DataBook."""
 
-    wb = Workbook()
-    for sheet in wb.worksheets:
-        wb.remove_sheet(sheet)
+    sheets = []
     for i, dset in enumerate(databook._datasets):
-        ws = wb.create_sheet()
-        ws.title = dset.title if dset.title else 'Sheet%s' % (i)
-
-        dset_sheet(dset, ws, freeze_panes=freeze_panes)
-
-    stream = BytesIO()
+        headers, rows = dset_rows(dset)
+        sheets.append((dset.title if dset.title else 'Sheet%s' % (i), headers, rows))
+    return write_book(sheets, freeze_panes=freeze_panes).read()
+
+
+def write_book(sheets, freeze_panes=True):
+    """
+    Writes (title, headers, rows) sheets row by row to a write-only workbook
+    and returns the temporary file it's saved to, positioned at its start.
+    `rows` may be any iterable: only one row is held in memory at a time.
+    """
+    wb = Workbook(write_only=True)
+    for title, headers, rows in sheets:
+        ws = wb.create_sheet(title=title)
+        write_rows(ws, headers, rows, freeze_panes=freeze_panes)
+
+    stream = tempfile.TemporaryFile()
     wb.save(stream)
-    return stream.getvalue()
+    stream.seek(0)
+    return stream
 
 
 def import_set(dset, in_stream, headers=True):
@@ -78,60 +89,133 @@ def import_book(dbook, import_file, headers=True):
 
     dbook.wipe()
 
-    xls_book = openpyxl.reader.excel.load_workbook(import_file)
+    xls_book = open_book(import_file, headers=headers)
 
-    for sheet in xls_book.worksheets:
-        data = tablib.Dataset()
-        data.title = sheet.title
+    try:
+        for sheet in xls_book.sheets():
+            data = tablib.Dataset()
+            data.title = sheet.title
+            if headers:
+                data.headers = sheet.headers
 
-        for i, row in enumerate(sheet.rows):
-            row_vals = [c.value for c in row]
-            if (i == 0) and (headers):
-                data.headers = row_vals
-            else:
+            for row_vals in sheet:
                 data.append(row_vals)
 
-        dbook.add_sheet(data)
+            dbook.add_sheet(data)
+    finally:
+        xls_book.close()
 
 
-def dset_sheet(dataset, ws, freeze_panes=True):
-    """Completes given worksheet from given Dataset."""
+def open_book(import_file, headers=True):
+    """Returns a LazyBook of given XLSX file, its rows are read as they're iterated."""
+
+    return LazyBook(import_file, headers=headers)
+
+
+class LazyBook(object):
+    """
+    Read-only workbook, has the `sheets()` of a tablib.Databook. Holds the
+    file open until `close()`.
+    """
+
+    def __init__(self, import_file, headers=True):
+        self.workbook = openpyxl.reader.excel.load_workbook(import_file, read_only=True, data_only=False)
+        self._sheets = [LazySheet(ws, headers=headers) for ws in self.workbook.worksheets]
+
+    def sheets(self):
+        return self._sheets
+
+    def active(self):
+        """The sheet the workbook opens on, the one tablib imports a Dataset from"""
+        return self._sheets[self.workbook.worksheets.index(self.workbook.active)]
+
+    def close(self):
+        self.workbook.close()
+
+
+class LazySheet(object):
+    """
+    Rows of a read-only worksheet, read one at a time. Has the `title`,
+    `headers`, `dict` and `len()` of a tablib.Dataset.
+    """
+
+    def __init__(self, ws, headers=True):
+        self.ws = ws
+        self.title = ws.title
+        self.headers = None
+        if headers:
+            first_row = next(ws.iter_rows(max_row=1, values_only=True), None)
+            self.headers = list(first_row) if first_row else []
+
+    def __len__(self):
+        # from the sheet dimensions, as written by the producing application
+        rows = self.ws.max_row or 0
+        return max(rows - 1, 0) if self.headers is not None else rows
+
+    def __iter__(self):
+        min_row = 2 if self.headers is not None else 1
+        width = len(self.headers) if self.headers is not None else 0
+        for row in self.ws.iter_rows(min_row=min_row, values_only=True):
+            row = list(row)
+            # read-only sheets leave out the empty cells ending a row
+            yield row + [None] * (width - len(row))
+
+    @property
+    def dict(self):
+        if self.headers is None:
+            return iter(self)
+        return (OrderedDict(zip(self.headers, row)) for row in self)
+
+
+def dset_rows(dataset):
+    """Returns the headers and the rows, separators included, of given Dataset."""
     _package = dataset._package(dicts=False)
 
     for i, sep in enumerate(dataset._separators):
         _offset = i
         _package.insert((sep[0] + _offset), (sep[1],))
 
-    bold = openpyxl.styles.Font(bold=True)
-    wrap_text = openpyxl.styles.Alignment(wrap_text=True)
-
-    for i, row in enumerate(_package):
-        row_number = i + 1
-        for j, col in enumerate(row):
-            col_idx = get_column_letter(j + 1)
-            cell = ws.cell('%s%s' % (col_idx, row_number))
-
-            # bold headers
-            if (row_number == 1) and dataset.headers:
-                # cell.value = unicode('%s' % col, errors='ignore')
-                cell.value = unicode(col)
-                cell.font = bold
-                if freeze_panes:
-                    #  Export Freeze only after first Line
-                    ws.freeze_panes = 'A2'
-
-            # bold separators
-            elif len(row) < dataset.width:
-                cell.value = unicode('%s' % col, errors='ignore')
-                cell.font = bold
-
-            # wrap the rest
-            else:
-                try:
-                    if '\n' in col:
-                        cell.value = unicode('%s' % col, errors='ignore')
-                        cell.alignment = wrap_text
-                    else:
-                        cell.value = unicode('%s' % col, errors='ignore')
-                except TypeError:
-                    cell.value = unicode(col)
+    if dataset.headers:
+        return _package[0], _package[1:]
+    return None, _package
+
+
+def styled_cell(ws, value, font=None, alignment=None):
+    cell = WriteOnlyCell(ws, value=value)
+    if font is not None:
+        cell.font = font
+    if alignment is not None:
+        cell.alignment = alignment
+    return cell
+
+
+def write_rows(ws, headers, rows, freeze_panes=True):
+    """Appends headers and rows to given write-only worksheet."""
+    if headers:
+        if freeze_panes:
+            #  Export Freeze only after first Line
+            ws.freeze_panes = 'A2'
+        # bold headers
+        ws.append([styled_cell(ws, unicode(col), font=bold) for col in headers])
+    width = len(headers) if headers else None
+
+    for row in rows:
+        # bold separators
+        if width and len(row) < width:
+            ws.append([styled_cell(ws, unicode('%s' % col), font=bold) for col in row])
+            continue
+
+        # wrap the rest
+        values = []
+        for col in row:
+            value = unicode('%s' % col)
+            if '\n' in value:
+                value = styled_cell(ws, value, alignment=wrap_text)
+            values.append(value)
+        ws.append(values)
+
+
+def dset_sheet(dataset, ws, freeze_panes=True):
+    """Completes given write-only worksheet from given Dataset."""
+    headers, rows = dset_rows(dataset)
+    write_rows(ws, headers, rows, freeze_panes=freeze_panes)
@@ -0,0 +1,41 @@
+import time
+
+from ..database_routers.replicas import (
+    DB_REPLICA_STICKY_SECONDS, get_written, pin, reset_pinning,
+)
+
+
+SESSION_KEY = '_db_written_at'
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Keeps the reads of a session on the primary database it wrote to for
+    DB_REPLICA_STICKY_SECONDS, so that it reads its own writes even though
+    the replicas lag behind. Goes after SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_pinning()
+        session = getattr(request, 'session', None)
+        now = time.time()
+        if session is not None:
+            for alias, written_at in session.get(SESSION_KEY, {}).items():
+                if now - written_at < DB_REPLICA_STICKY_SECONDS:
+                    pin(alias, seconds=DB_REPLICA_STICKY_SECONDS - (now - written_at))
+        try:
+            response = self.get_response(request)
+            written = get_written()
+            if session is not None and written:
+                written_at = {
+                    alias: at for alias, at in session.get(SESSION_KEY, {}).items()
+                    if now - at < DB_REPLICA_STICKY_SECONDS
+                }
+                written_at.update((alias, time.time()) for alias in written)
+                session[SESSION_KEY] = written_at
+            return response
+        finally:
+            reset_pinning()
@@ -63,6 +63,7 @@ MIDDLEWARE = [
     # 'analytics.middleware.VisitorTrackingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    # '{{cookiecutter.project_name}}.middleware.replica.ReplicaPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -114,10 +115,21 @@ WSGI_APPLICATION = '{{cookiecutter.project_name}}.wsgi.application'
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
 DATABASES = {}
+# Per process connection pools, see {{cookiecutter.project_name}}/db_backends/postgresql_pool/base.py
+#     'ENGINE': '{{cookiecutter.project_name}}.db_backends.postgresql_pool',
+#     'POOL': {'MIN_SIZE': 1, 'MAX_SIZE': 2},
 
 EXPLORER_CONNECTIONS = { 'Default': 'default' }
 EXPLORER_DEFAULT_CONNECTION = 'default'
 
+WATCHMAN_CHECKS = (
+    'watchman.checks.caches',
+    'watchman.checks.databases',
+    'watchman.checks.storage',
+    # 'analytics.metrics.watchman_check',  # with 'analytics' in INSTALLED_APPS
+    # '{{cookiecutter.project_name}}.db_backends.postgresql_pool.pool.watchman_check',  # with the pooling ENGINE
+)
+
 # DB_APP_ROUTER = {
 #     'analytics': (
 #         'analytics',
@@ -127,6 +139,18 @@ EXPLORER_DEFAULT_CONNECTION = 'default'
 #     ),
 # }
 
+# Reads go to the replicas of a database unless they lag more than
+# DB_REPLICA_MAX_LAG seconds, or the request / session wrote to it
+# DB_REPLICA_ROUTER = {
+#     'default': {
+#         'replica_1': 2,  # weight
+#         'replica_2': 1,
+#     },
+# }
+# DB_REPLICA_MAX_LAG = 5
+# DB_REPLICA_LAG_CHECK_INTERVAL = 10
+# DB_REPLICA_STICKY_SECONDS = 15
+
 ALLOW_DATABASE_UNION = False
 
 LOGGING = {}